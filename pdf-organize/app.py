@@ -1,40 +1,69 @@
 import os
+import signal
 import time
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import json
 import re
-import fitz  # PyMuPDF
-import google.generativeai as genai
-from google.generativeai import types # Added for inline data
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from dotenv import load_dotenv
 import logging
 import shutil
+from cache import DocumentIndex, hash_file, hash_text
+from classifier import LocalClassifier
+from backends import get_backend
+from retry_queue import RetryQueue
+from extraction import MemoryBudget, available_cpus, build_excerpt, estimate_excerpt_cost, read_first_page_text, read_text
+from metrics import DocumentTrace, configure_trace_log, metrics, start_metrics_server
+from sources import find_source, load_sources, make_source
 
 # --- Configuration ---
 load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'gemini').lower() # gemini | ollama | stub, see backends.py
 INPUT_DIR = os.getenv('INPUT_DIR', '/input')
 OUTPUT_DIR = os.getenv('OUTPUT_DIR', '/output')
 PAGES_TO_ANALYZE = int(os.getenv('PAGES_TO_ANALYZE', 3))
 KEEP_ORIGINAL_FILE = os.getenv('KEEP_ORIGINAL_FILE', 'false').lower() == 'true'
-
-if not GEMINI_API_KEY:
-    logging.error("GEMINI_API_KEY environment variable not set.")
-    exit(1)
-
-genai.configure(api_key=GEMINI_API_KEY) # Configure the Gemini client
-generation_config = {
-    "temperature": 0.7, # Controls randomness (higher = more creative)
-    "top_p": 1,         # Nucleus sampling parameter
-    "top_k": 1,         # Top-k sampling parameter
-    "max_output_tokens": 2048, # Maximum length of the response
-    "response_mime_type": "application/json", # Expect JSON output from the model
-}
-model = genai.GenerativeModel(model_name="gemini-2.0-flash", # Specify the Gemini model
-                              generation_config=generation_config)
+CACHE_DB = os.getenv('CACHE_DB', os.path.join(OUTPUT_DIR, '.pdf_organizer_cache.sqlite3'))
+DUPLICATE_ACTION = os.getenv('DUPLICATE_ACTION', 'file').lower() # file | hardlink | drop
+WORKERS = int(os.getenv('WORKERS', 4)) # Number of PDFs processed concurrently
+STARTUP_SCAN = os.getenv('STARTUP_SCAN', 'true').lower() == 'true' # Process PDFs already in the input directories at startup
+FILE_SETTLE_SECONDS = 2 # Wait after a create event so the file is fully written
+LOCAL_CLASSIFIER = os.getenv('LOCAL_CLASSIFIER', 'true').lower() == 'true' # Route confident matches without the LLM
+CLASSIFIER_INDEX = os.getenv('CLASSIFIER_INDEX') # Index of OUTPUT_DIR, defaults to a hidden file in it
+CLASSIFIER_MIN_SIMILARITY = float(os.getenv('CLASSIFIER_MIN_SIMILARITY', 0.5)) # Cosine similarity of the best neighbour
+CLASSIFIER_MIN_AGREEMENT = float(os.getenv('CLASSIFIER_MIN_AGREEMENT', 0.8)) # Share of neighbour votes for the folder
+CLASSIFIER_MIN_DOCUMENTS = int(os.getenv('CLASSIFIER_MIN_DOCUMENTS', 20)) # Don't trust a nearly empty index
+EXTRACTION_MEMORY_MB = int(os.getenv('EXTRACTION_MEMORY_MB', 1024)) # Memory shared by concurrent PDF extractions
+MAX_IMAGE_DIM = int(os.getenv('MAX_IMAGE_DIM', 2000)) # Larger images are downsampled before sending
+EXCERPT_DPI = int(os.getenv('EXCERPT_DPI', 150)) # Target resolution of downsampled images
+MAX_EXCERPT_MB = int(os.getenv('MAX_EXCERPT_MB', 15)) # Downsample when the first pages' images exceed this
+EXTRACT_PROCESSES = int(os.getenv('EXTRACT_PROCESSES', 0)) or available_cpus() # PyMuPDF worker processes, 0 means one per core
+THUMBNAIL_DPI = int(os.getenv('THUMBNAIL_DPI', 30)) # Resolution of the first-page thumbnail for vision backends
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', 5)) # Attempts before a PDF is dead-lettered
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', 30)) # Seconds before the first retry, doubled per attempt
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', 3600)) # Upper bound for the backoff
+RETRY_POLL_SECONDS = 5 # How often the scheduler looks for due retries
+DEAD_LETTER_DIR = os.getenv('DEAD_LETTER_DIR') # Permanent failures from INPUT_DIR, defaults to INPUT_DIR/.failed
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108)) # Prometheus /metrics endpoint, 0 disables it
+TRACE_LOG = os.getenv('TRACE_LOG', '') # JSON-lines file for per-document timings ('-' for stdout)
+WATCH_CONFIG = os.getenv('WATCH_CONFIG', '') # JSON file listing several input roots with their own rules, see sources.py
+
+_document_index = None # Opened on first use, see get_document_index()
+_local_classifiers = {} # Classifier index file -> classifier, loaded on first use, see get_local_classifier()
+_retry_queue = None # Opened on first use, see get_retry_queue()
+_extraction_pool = None # Started on first use, see get_extraction_pool()
+_extraction_pool_lock = threading.Lock()
+extraction_budget = MemoryBudget(EXTRACTION_MEMORY_MB * 1024 * 1024)
+_classifier_lock = threading.Lock()
+_content_claims = {} # Content hash -> Event set when the worker filing those bytes is done, see claim_content()
+_content_claims_lock = threading.Lock()
 
 # --- Helper Functions ---
 
@@ -65,26 +94,287 @@ def get_dir_structure(rootdir):
     return "\n".join(structure) if structure else "Output directory is empty."
 
 
-def organize_pdf(pdf_path):
-    """Extracts info, calls LLM, and moves the PDF."""
+def get_document_index():
+    """Returns the shared content-hash index, opening the SQLite database on first use."""
+    global _document_index
+    if _document_index is None:
+        _document_index = DocumentIndex(CACHE_DB)
+    return _document_index
+
+
+def get_retry_queue():
+    """Returns the shared persistent retry queue, stored alongside the document index."""
+    global _retry_queue
+    if _retry_queue is None:
+        _retry_queue = RetryQueue(CACHE_DB, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                                  max_attempts=RETRY_MAX_ATTEMPTS)
+    return _retry_queue
+
+
+def get_extraction_pool():
+    """Returns the shared process pool for CPU-bound PyMuPDF work, starting it on first use.
+
+    Workers are spawned rather than forked so they don't inherit the threads, locks and SQLite
+    connections of this process. Only paths go in and compact results come back.
+    """
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            _extraction_pool = ProcessPoolExecutor(max_workers=EXTRACT_PROCESSES,
+                                                   mp_context=multiprocessing.get_context('spawn'))
+    return _extraction_pool
+
+
+def extract(function, *args):
+    """Runs an extraction function in the process pool and waits for its result."""
+    return get_extraction_pool().submit(function, *args).result()
+
+
+def get_local_classifier(source):
+    """Returns the nearest-neighbour classifier of a source's output root, loading its index on first use."""
+    with _classifier_lock:
+        if source.classifier_index not in _local_classifiers:
+            _local_classifiers[source.classifier_index] = LocalClassifier(source.classifier_index)
+        return _local_classifiers[source.classifier_index]
+
+
+def save_local_classifiers():
+    """Writes every loaded classifier index to disk."""
+    with _classifier_lock:
+        classifiers = list(_local_classifiers.values())
+    for classifier in classifiers:
+        classifier.save()
+
+
+def folder_label(full_dest_path, output_dir):
+    """Returns the folder of a filed PDF relative to its output root, as used for classifier labels."""
+    return os.path.relpath(os.path.dirname(full_dest_path), output_dir)
+
+
+def is_within(path, directory):
+    """True if path lies inside directory."""
+    return os.path.commonpath([os.path.abspath(path), directory]) == directory
+
+
+def build_classifier_index(classifier, rootdir):
+    """Seeds the classifier with the first-page text of the PDFs already organized in rootdir.
+
+    Runs on every start until one seeding has finished, so an index saved before then (say by a
+    bulk run that ended first) is rebuilt rather than kept incomplete.
+    """
+    if classifier.seeded:
+        return
+    logging.info(f"Building local classifier index from {rootdir}...")
+
+    # Listed inside seed(), so PDFs filed from here on are held back by the classifier, not indexed twice
+    def documents():
+        pdf_paths = []
+        for dirpath, dirnames, filenames in os.walk(rootdir):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            if os.path.samefile(dirpath, rootdir):
+                continue # Files in the root aren't in a category
+            pdf_paths.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith('.pdf'))
+        texts = get_extraction_pool().map(read_first_page_text, pdf_paths, chunksize=16)
+        for pdf_path, text in zip(pdf_paths, texts):
+            if text is None:
+                logging.warning(f"Skipping {pdf_path} for classifier index: could not read it")
+                continue
+            yield os.path.abspath(pdf_path), text, folder_label(pdf_path, rootdir)
+
+    added = classifier.seed(documents())
+    logging.info(f"Classifier index built from {added} PDF(s).")
+
+
+def local_filename(metadata, pdf_path):
+    """Builds a filename without the LLM: Title_Author.pdf from metadata, else the original name."""
+    title = (metadata.get('title') or '').strip()
+    author = (metadata.get('author') or '').strip()
+    if title:
+        name = f"{title[:64]}_{author[:32]}" if author else title[:64]
+        return sanitize_filename(name) + '.pdf'
+    return sanitize_filename(os.path.basename(pdf_path))
+
+
+def classify_locally(first_page_text, source):
+    """Returns the destination folder for a confident local match, or None to escalate to the LLM."""
+    classifier = get_local_classifier(source)
+    if len(classifier) < CLASSIFIER_MIN_DOCUMENTS:
+        return None
+    prediction = classifier.predict(first_page_text)
+    if prediction is None:
+        return None
+    logging.info(f"Local classifier: '{prediction.label}' (similarity {prediction.similarity:.2f}, "
+                 f"agreement {prediction.agreement:.2f})")
+    if prediction.similarity < CLASSIFIER_MIN_SIMILARITY or prediction.agreement < CLASSIFIER_MIN_AGREEMENT:
+        return None
+    dest_dir = os.path.join(source.output_dir, prediction.label)
+    if not os.path.isdir(dest_dir):
+        return None # Folder was removed or renamed since it was indexed
+    return dest_dir
+
+
+def reserve_destination(full_dest_path):
+    """Claims a free destination path, appending a counter to the filename on collisions.
+
+    The path is reserved by creating an empty placeholder exclusively, so concurrent workers
+    filing to the same name can't overwrite each other. Callers replace the placeholder.
+    """
+    counter = 1
+    base, ext = os.path.splitext(full_dest_path)
+    candidate = full_dest_path
+    while True:
+        try:
+            with open(candidate, 'x'):
+                break
+        except FileExistsError:
+            logging.warning(f"Destination file already exists: {candidate}. Appending counter.")
+            candidate = f"{base}_{counter}{ext}"
+            counter += 1
+    if candidate != full_dest_path:
+        logging.info(f"Adjusted destination path to: {candidate}")
+    return candidate
+
+
+def file_pdf(pdf_path, full_dest_path):
+    """Moves the PDF to its destination (creating folders, avoiding overwrites) and returns the final path."""
+    os.makedirs(os.path.dirname(full_dest_path), exist_ok=True)
+    full_dest_path = reserve_destination(full_dest_path)
+
+    try:
+        shutil.move(pdf_path, full_dest_path)
+    except Exception:
+        os.remove(full_dest_path) # Release the placeholder
+        raise
+    logging.info(f"Moved '{os.path.basename(pdf_path)}' to '{full_dest_path}'")
+
+    if not KEEP_ORIGINAL_FILE:
+        # The file is always moved, so KEEP_ORIGINAL_FILE=true has no effect yet
+        logging.info(f"Original file '{pdf_path}' implicitly removed by move.")
+    return full_dest_path
+
+
+def handle_duplicate(pdf_path, existing_path):
+    """Handles a byte-identical copy of an already filed PDF according to DUPLICATE_ACTION."""
+    logging.info(f"'{os.path.basename(pdf_path)}' is an exact duplicate of '{existing_path}' (action: {DUPLICATE_ACTION})")
+    if DUPLICATE_ACTION == 'drop':
+        os.remove(pdf_path)
+        logging.info(f"Dropped duplicate '{pdf_path}'")
+        return existing_path
+    if DUPLICATE_ACTION == 'hardlink':
+        link_path = reserve_destination(existing_path)
+        temp_link_path = f"{link_path}.{threading.get_ident()}.tmp"
+        try:
+            os.link(existing_path, temp_link_path)
+            os.replace(temp_link_path, link_path) # Atomically swap in for the placeholder
+        except OSError as e:
+            os.remove(link_path)
+            # Hardlinks don't work across filesystems; fall back to a normal move
+            logging.warning(f"Could not hardlink '{link_path}' to '{existing_path}' ({e}), moving instead.")
+            return file_pdf(pdf_path, existing_path)
+        os.remove(pdf_path)
+        logging.info(f"Hardlinked duplicate to '{link_path}'")
+        return link_path
+    return file_pdf(pdf_path, existing_path)
+
+
+def claim_content(content_hash):
+    """Makes this worker the only one filing these bytes. Copies picked up at the same time wait
+    until the first one is done, then find it in the index and take the duplicate path."""
+    while True:
+        with _content_claims_lock:
+            done = _content_claims.get(content_hash)
+            if done is None:
+                _content_claims[content_hash] = threading.Event()
+                return
+        done.wait()
+
+
+def release_content(content_hash):
+    with _content_claims_lock:
+        done = _content_claims.pop(content_hash)
+    done.set()
+
+
+def organize_pdf(pdf_path, source, trace=None):
+    """Extracts info, calls LLM, and moves the PDF according to its source's rules. Returns True if the file was handled."""
     logging.info(f"Processing new file: {pdf_path}")
+    trace = trace or DocumentTrace(pdf_path)
+    output_dir = source.output_dir
+    pages_to_analyze = source.pages_to_analyze
+    llm_backend = source.backend
     pdf_bytes = None # Initialize pdf_bytes
+    thumbnail_png = None
+    content_hash = None
     try:
-        original_doc = fitz.open(pdf_path)
-        metadata = original_doc.metadata
-        pages_to_read = min(PAGES_TO_ANALYZE, len(original_doc))
-
-        # Create a new in-memory PDF with the first pages
-        temp_doc = fitz.open() # Create a new empty PDF
-        temp_doc.insert_pdf(original_doc, from_page=0, to_page=pages_to_read - 1)
-        pdf_bytes = temp_doc.tobytes() # Get bytes of the new PDF
-        temp_doc.close()
-        original_doc.close() # Close the original PDF document
+        index = get_document_index()
+        with trace.span('hash'):
+            content_hash = hash_file(pdf_path)
+        claim_content(content_hash)
+
+        # Exact duplicates of a filed document never need the LLM. The index is shared by all
+        # sources, so only destinations inside this source's output root count.
+        known_path = index.lookup_content(content_hash)
+        if known_path and not is_within(known_path, output_dir):
+            known_path = None
+        if known_path and os.path.exists(known_path):
+            metrics.inc('pdf_organizer_cache_hits_total', kind='content')
+            with trace.span('move'):
+                final_path = handle_duplicate(pdf_path, known_path)
+            trace.finish('duplicate', destination=final_path)
+            return True
+
+        with trace.span('extract'):
+            document = extract(read_text, pdf_path, pages_to_analyze)
+            metadata = document.metadata
+            page_texts = document.page_texts
+            pages_to_read = len(page_texts)
+            first_pages_text = "".join(page_texts)
+            first_page_text = page_texts[0] if page_texts else ''
+            text_hash = hash_text(first_pages_text)
+
+        # Same text as a filed document (e.g. a re-download with different bytes): reuse its destination
+        cached_path = known_path or index.lookup_text(text_hash)
+        if cached_path and is_within(cached_path, output_dir):
+            logging.info(f"Cache hit for '{os.path.basename(pdf_path)}', routing to '{cached_path}' without LLM call")
+            metrics.inc('pdf_organizer_cache_hits_total', kind='text')
+            with trace.span('move'):
+                final_path = file_pdf(pdf_path, cached_path)
+            index.record(content_hash, text_hash, final_path)
+            trace.finish('cache', destination=final_path)
+            return True
+
+        # Confident nearest-neighbour matches are filed without asking the LLM
+        with trace.span('local_classifier'):
+            local_dir = classify_locally(first_page_text, source) if LOCAL_CLASSIFIER else None
+        if local_dir:
+            logging.info(f"Routing '{os.path.basename(pdf_path)}' to '{local_dir}' via local classifier")
+            with trace.span('move'):
+                final_path = file_pdf(pdf_path, os.path.join(local_dir, local_filename(metadata, pdf_path)))
+            index.record(content_hash, text_hash, final_path)
+            get_local_classifier(source).add(first_page_text, folder_label(final_path, output_dir),
+                                             key=os.path.abspath(final_path))
+            trace.finish('local_classifier', destination=final_path)
+            return True
+
+        # Create a compact PDF with the first pages, within the shared memory budget
+        backend = get_backend(llm_backend)
+        with trace.span('extract'):
+            cost = extract(estimate_excerpt_cost, pdf_path, pages_to_analyze, MAX_IMAGE_DIM, MAX_EXCERPT_MB * 1024 * 1024)
+        with trace.span('memory_wait'):
+            reserved = extraction_budget.acquire(cost)
+        try:
+            with trace.span('extract'):
+                pdf_bytes, thumbnail_png = extract(build_excerpt, pdf_path, pages_to_analyze, MAX_IMAGE_DIM,
+                                                   MAX_EXCERPT_MB * 1024 * 1024, EXCERPT_DPI,
+                                                   THUMBNAIL_DPI if backend.wants_thumbnail else 0)
+        finally:
+            extraction_budget.release(reserved)
 
         title = metadata.get('title', '') # Extract title from metadata
         author = metadata.get('author', '') # Extract author from metadata
 
-        dir_structure = get_dir_structure(OUTPUT_DIR) # Get current directory structure
+        with trace.span('dir_structure'):
+            dir_structure = get_dir_structure(output_dir) # Get current directory structure
 
         prompt = f"""
 Analyze the provided PDF data (representing the first {pages_to_read} pages of the original document) and its metadata to determine the appropriate category and subcategory for organization.
@@ -115,121 +405,386 @@ Ensure the final output is valid JSON.
 """
         if not pdf_bytes:
              logging.error("Failed to extract bytes from the first pages.")
-             return
+             trace.finish('failed', error="no bytes extracted from the first pages")
+             return False
 
-        logging.info("Sending request to Gemini with inline PDF data...")
-        # Send PDF bytes inline along with the prompt
-        response = model.generate_content([
-            types.Part.from_bytes(data=pdf_bytes, mime_type='application/pdf'),
-            prompt
-        ])
+        logging.info(f"Sending request to {llm_backend} backend...")
+        try:
+            with trace.span('llm'):
+                json_text = backend.classify(prompt, pdf_bytes, first_pages_text, thumbnail_png)
+        except Exception as e:
+            logging.error(f"{llm_backend} request failed for {pdf_path}: {e}")
+            trace.finish('failed', error=str(e))
+            return False
 
         # --- Response Parsing ---
         try:
-            # Accessing the JSON content correctly based on google-generativeai SDK
-            if response.parts:
-                 # Assuming the first part contains the JSON text if mime_type is application/json
-                 json_text = response.parts[0].text
-                 logging.info(f"Received Gemini response text: {json_text}")
-                 result = json.loads(json_text)
-                 suggested_rel_path = result.get("path")
-            else:
-                 # Fallback or error if no parts or text found
-                 logging.error(f"Gemini response format unexpected or empty: {response}")
-                 suggested_rel_path = None
-
+            logging.info(f"Received {llm_backend} response text: {json_text}")
+            result = json.loads(json_text)
+            suggested_rel_path = result.get("path") if isinstance(result, dict) else None
 
             if not suggested_rel_path:
-                logging.error("Gemini response did not contain a valid 'path'.")
+                logging.error(f"{llm_backend} response did not contain a valid 'path'.")
                 # Decide error handling: move to error folder or just log and skip?
-                return # Skip for now
+                trace.finish('failed', error="response did not contain a path")
+                return False # Skip for now
 
             # Basic sanitization (more robust might be needed)
             # Prevent path traversal, remove leading slashes
             suggested_rel_path = suggested_rel_path.lstrip('/')
             # Further sanitization might be needed depending on LLM output variance
 
-            full_dest_path = os.path.join(OUTPUT_DIR, suggested_rel_path)
-            dest_dir = os.path.dirname(full_dest_path)
+            full_dest_path = os.path.join(output_dir, suggested_rel_path)
 
             logging.info(f"Suggested path: {suggested_rel_path}")
 
             # --- File Operations ---
-            os.makedirs(dest_dir, exist_ok=True)
-
-            # Check if destination file already exists and append counter if needed
-            counter = 1
-            original_full_dest_path = full_dest_path
-            base, ext = os.path.splitext(full_dest_path)
-            while os.path.exists(full_dest_path):
-                logging.warning(f"Destination file already exists: {full_dest_path}. Appending counter.")
-                full_dest_path = f"{base}_{counter}{ext}"
-                counter += 1
-
-            if full_dest_path != original_full_dest_path:
-                 logging.info(f"Adjusted destination path to: {full_dest_path}")
-
-            shutil.move(pdf_path, full_dest_path)
-            logging.info(f"Moved '{os.path.basename(pdf_path)}' to '{full_dest_path}'")
-
-            if not KEEP_ORIGINAL_FILE:
-                # Deletion is handled by watchdog after move completes if needed,
-                # but explicit delete might be desired if move fails or for clarity.
-                # Let's keep it simple: move implies removal from source.
-                logging.info(f"Original file '{pdf_path}' implicitly removed by move.")
-                # If KEEP_ORIGINAL_FILE was true, we would copy instead of move.
-                # However, the current logic uses move, so KEEP_ORIGINAL_FILE=true
-                # doesn't make sense without changing shutil.move to shutil.copy.
-                # Let's assume move is the primary action, and KEEP_ORIGINAL_FILE=false is default.
-                # If KEEP_ORIGINAL_FILE is true, we should copy then potentially delete source based on another flag?
-                # Revisit this logic if KEEP_ORIGINAL_FILE=true is a hard requirement with the current move strategy.
-                # For now, move implies removal.
-                pass
-
+            with trace.span('move'):
+                final_path = file_pdf(pdf_path, full_dest_path)
+            index.record(content_hash, text_hash, final_path)
+            if LOCAL_CLASSIFIER:
+                get_local_classifier(source).add(first_page_text, folder_label(final_path, output_dir),
+                                                 key=os.path.abspath(final_path))
+            trace.finish('llm', destination=final_path)
+            return True
 
         except json.JSONDecodeError:
-            logging.error(f"Failed to decode JSON response from Gemini: {json_text}")
+            logging.error(f"Failed to decode JSON response from {llm_backend}: {json_text}")
+            trace.finish('failed', error="invalid JSON response")
         except Exception as e:
-            logging.error(f"Error processing Gemini response or moving file: {e}")
+            logging.error(f"Error processing {llm_backend} response or moving file: {e}")
+            trace.finish('failed', error=str(e))
 
     except Exception as e:
         logging.error(f"Error opening or reading PDF {pdf_path}: {e}")
+        trace.finish('failed', error=str(e))
+    finally:
+        if content_hash is not None:
+            release_content(content_hash)
+    return False
+
+
+# --- Retries ---
+def move_to_dead_letter(pdf_path, source, error, attempts):
+    """Moves a PDF that keeps failing to its source's dead-letter folder, with the last error in a sidecar file."""
+    os.makedirs(source.dead_letter_dir, exist_ok=True)
+    dest_path = reserve_destination(os.path.join(source.dead_letter_dir, os.path.basename(pdf_path)))
+    shutil.move(pdf_path, dest_path)
+    with open(f"{dest_path}.error.txt", 'w', encoding='utf-8') as f:
+        f.write(f"Source: {pdf_path}\nAttempts: {attempts}\nLast error: {error}\n")
+    metrics.inc('pdf_organizer_dead_letters_total')
+    logging.error(f"Giving up on '{pdf_path}' after {attempts} attempt(s), moved to '{dest_path}': {error}")
+
+
+def handle_result(pdf_path, source, trace):
+    """Updates the retry queue after an attempt: clears successes, backs off or dead-letters failures."""
+    queue = get_retry_queue()
+    if trace.status != 'failed':
+        queue.clear(pdf_path)
+        # A successful LLM call means the backend is reachable again: drain its failures right away
+        if trace.status == 'llm':
+            expedited = queue.expedite_llm_errors()
+            if expedited:
+                logging.info(f"LLM backend is responding again, retrying {expedited} file(s) now.")
+        return
+    error = trace.fields.get('error', 'unknown error')
+    if not os.path.exists(pdf_path):
+        queue.clear(pdf_path) # Nothing left to retry
+        return
+    attempts, delay = queue.record_failure(pdf_path, error, llm_error='llm' in trace.spans)
+    if delay is None:
+        try:
+            move_to_dead_letter(pdf_path, source, error, attempts)
+        except Exception as e:
+            logging.error(f"Could not move '{pdf_path}' to dead-letter folder: {e}")
+        return
+    metrics.inc('pdf_organizer_retries_total')
+    logging.warning(f"Will retry '{pdf_path}' in {delay:.0f}s (attempt {attempts + 1}/{RETRY_MAX_ATTEMPTS}).")
+
+
+def submit_due_retries(pool):
+    """Queues every file whose backoff has expired and returns the futures."""
+    queue = get_retry_queue()
+    futures = []
+    for pdf_path in queue.due():
+        if not os.path.exists(pdf_path) or find_source(pool.sources, pdf_path) is None:
+            queue.clear(pdf_path) # Gone, or no longer in a watched root
+            continue
+        future = pool.submit(pdf_path)
+        if future is not None:
+            futures.append(future)
+    return futures
+
+
+def run_retry_scheduler(pool, stop_event):
+    """Resubmits due retries to the worker pool until stop_event is set."""
+    while not stop_event.wait(RETRY_POLL_SECONDS):
+        try:
+            submit_due_retries(pool)
+        except Exception as e:
+            logging.error(f"Retry scheduler error: {e}")
+
+
+def drain_retries(pool):
+    """Bulk mode: keeps retrying failed files until each succeeds or is dead-lettered."""
+    queue = get_retry_queue()
+    while True:
+        wait = queue.next_due_in()
+        if wait is None:
+            return
+        if wait > 0:
+            logging.info(f"{len(queue)} PDF(s) waiting for retry, next attempt in {wait:.0f}s.")
+            time.sleep(min(wait, 60))
+            continue
+        for future in as_completed(submit_due_retries(pool)):
+            pass
+
+
+# --- Processing Pipeline ---
+class ProcessingPool:
+    """Runs organize_pdf on a shared thread pool, skipping paths that are already queued or running.
+
+    Every source has its own queue. A free worker takes the next file from the source that is
+    furthest below its concurrency share, so a large drop into one root can't starve the others,
+    while idle capacity is still used by whichever roots have work.
+    """
+
+    def __init__(self, workers, sources):
+        self.workers = workers
+        self.sources = sources
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="organize")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._queues = {source.input_dir: deque() for source in sources}
+        self._running = {source.input_dir: 0 for source in sources}
+        self._busy = 0
+        self._closed = False
+
+    def submit(self, pdf_path, delay=0):
+        """Queues a PDF for processing. Returns a Future, or None if the path is already queued or not in a source."""
+        pdf_path = os.path.abspath(pdf_path)
+        source = find_source(self.sources, pdf_path)
+        if source is None:
+            return None
+        future = Future()
+        with self._lock:
+            if self._closed or pdf_path in self._pending:
+                return None
+            self._pending.add(pdf_path)
+            self._queues[source.input_dir].append((pdf_path, source, delay, future))
+            metrics.set('pdf_organizer_queue_depth', len(self._pending))
+            self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """Starts queued files while workers are free. Must be called with the lock held."""
+        while not self._closed and self._busy < self.workers:
+            waiting = [source for source in self.sources if self._queues[source.input_dir]]
+            if not waiting:
+                return
+            source = min(waiting, key=lambda s: self._running[s.input_dir] / s.share)
+            self._running[source.input_dir] += 1
+            self._busy += 1
+            self._executor.submit(self._run, *self._queues[source.input_dir].popleft())
+
+    def _run(self, pdf_path, source, delay, future):
+        try:
+            if delay:
+                time.sleep(delay)
+            # The file may have been handled by an earlier submission or removed meanwhile
+            if os.path.exists(pdf_path):
+                trace = DocumentTrace(pdf_path)
+                organize_pdf(pdf_path, source, trace)
+                handle_result(pdf_path, source, trace)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(None)
+        finally:
+            with self._lock:
+                self._pending.discard(pdf_path)
+                self._running[source.input_dir] -= 1
+                self._busy -= 1
+                metrics.set('pdf_organizer_queue_depth', len(self._pending))
+                self._dispatch()
+
+    def shutdown(self, wait=True):
+        """Stops taking work. Queued files that haven't started are left in place for the next run."""
+        with self._lock:
+            self._closed = True
+            for queue in self._queues.values():
+                for pdf_path, _, _, future in queue:
+                    self._pending.discard(pdf_path)
+                    future.cancel()
+                queue.clear()
+        self._executor.shutdown(wait=wait)
+
+
+def scan_input_dir(input_dir):
+    """Returns the PDFs already present under input_dir, skipping hidden folders such as .failed."""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+        for filename in filenames:
+            if filename.lower().endswith('.pdf'):
+                pdf_path = os.path.join(dirpath, filename)
+                try:
+                    entries.append((os.path.getsize(pdf_path), pdf_path))
+                except OSError:
+                    continue # Removed while scanning
+    return entries
+
+
+def scan_sources(sources):
+    """Returns the PDFs already present in all sources, smallest first so quick wins land early."""
+    entries = [entry for source in sources for entry in scan_input_dir(source.input_dir)]
+    entries.sort()
+    return [path for _, path in entries]
+
+
+def process_backlog(pool, pdf_paths):
+    """Pushes existing PDFs through the pool and logs progress as they complete."""
+    futures = [future for future in (pool.submit(path) for path in pdf_paths) if future is not None]
+    total = len(futures)
+    if not total:
+        logging.info("No existing PDFs to process.")
+        return
+    logging.info(f"Processing backlog of {total} PDF(s) with {pool.workers} worker(s)...")
+    report_every = max(1, total // 100) # Roughly every percent
+    start_time = time.monotonic()
+    for done, _ in enumerate(as_completed(futures), start=1):
+        if done % report_every == 0 or done == total:
+            elapsed = time.monotonic() - start_time
+            rate = done / elapsed if elapsed > 0 else 0.0
+            logging.info(f"Backlog progress: {done}/{total} ({done * 100 // total}%), {rate:.2f} files/s")
 
 
 # --- Watchdog Event Handler ---
 class PDFHandler(FileSystemEventHandler):
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
     def on_created(self, event):
         if not event.is_directory and event.src_path.lower().endswith('.pdf'):
-            # Wait a moment to ensure file writing is complete
-            time.sleep(2)
-            organize_pdf(event.src_path)
+            # Wait a moment (on the worker, not the event thread) to ensure file writing is complete.
+            # Files in hidden folders (e.g. the dead-letter folder) are ignored by the pool.
+            self.pool.submit(event.src_path, delay=FILE_SETTLE_SECONDS)
 
 # --- Main Execution ---
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Organize PDFs into folders using an LLM.")
+    parser.add_argument("--bulk", action="store_true", help="Process the PDFs already in the input directories and exit instead of watching.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"Number of PDFs processed concurrently (default: {WORKERS}).")
+    return parser.parse_args()
+
+
+def load_watch_sources():
+    """Returns the roots to watch: those listed in WATCH_CONFIG, or INPUT_DIR/OUTPUT_DIR as the only root."""
+    default = make_source(INPUT_DIR, OUTPUT_DIR, PAGES_TO_ANALYZE, LLM_BACKEND,
+                          dead_letter_dir=DEAD_LETTER_DIR, classifier_index=CLASSIFIER_INDEX)
+    if not WATCH_CONFIG:
+        return [default]
+    return load_sources(WATCH_CONFIG, default)
+
+
 if __name__ == "__main__":
-    if not os.path.exists(INPUT_DIR):
-        logging.error(f"Input directory does not exist: {INPUT_DIR}")
+    args = parse_arguments()
+    WORKERS = args.workers
+
+    try:
+        sources = load_watch_sources()
+        for backend_name in sorted({source.backend for source in sources}):
+            get_backend(backend_name) # Validates configuration; clients connect on first request
+    except (OSError, ValueError) as e:
+        logging.error(str(e))
         exit(1)
-    if not os.path.exists(OUTPUT_DIR):
-        logging.info(f"Output directory does not exist, creating: {OUTPUT_DIR}")
-        os.makedirs(OUTPUT_DIR)
+
+    for source in sources:
+        if not os.path.exists(source.input_dir):
+            logging.error(f"Input directory does not exist: {source.input_dir}")
+            exit(1)
+        if not os.path.exists(source.output_dir):
+            logging.info(f"Output directory does not exist, creating: {source.output_dir}")
+            os.makedirs(source.output_dir)
 
     logging.info(f"Starting PDF Organizer...")
-    logging.info(f"Monitoring directory: {INPUT_DIR}")
-    logging.info(f"Output directory: {OUTPUT_DIR}")
-    logging.info(f"Pages to analyze: {PAGES_TO_ANALYZE}")
+    for source in sources:
+        logging.info(f"Monitoring directory: {source.input_dir} -> {source.output_dir} "
+                     f"(pages to analyze: {source.pages_to_analyze}, LLM backend: {source.backend}, share: {source.share:g})")
     logging.info(f"Keep original file: {KEEP_ORIGINAL_FILE}")
-
-    event_handler = PDFHandler()
+    logging.info(f"Workers: {WORKERS}")
+    logging.info(f"Extraction processes: {EXTRACT_PROCESSES}")
+    logging.info(f"Local classifier: {LOCAL_CLASSIFIER}")
+
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        logging.info(f"Metrics served on port {METRICS_PORT} at /metrics")
+    if TRACE_LOG:
+        configure_trace_log(TRACE_LOG)
+        logging.info(f"Writing per-document traces to {TRACE_LOG}")
+
+    # docker stop sends SIGTERM: shut down as on Ctrl+C, so the classifier index gets saved
+    def raise_keyboard_interrupt(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+
+    pool = ProcessingPool(WORKERS, sources)
+
+    if LOCAL_CLASSIFIER:
+        # Seeding reads every organized PDF once, so don't hold up the watcher for it
+        seeded = {}
+        for source in sources:
+            seeded.setdefault(source.classifier_index, source)
+        for source in seeded.values():
+            threading.Thread(target=build_classifier_index, args=(get_local_classifier(source), source.output_dir),
+                             name="classifier-index", daemon=True).start()
+
+    if args.bulk:
+        logging.info("Running in bulk mode: processing existing PDFs, then exiting.")
+        try:
+            process_backlog(pool, scan_sources(sources))
+            drain_retries(pool)
+        except KeyboardInterrupt:
+            logging.info("Bulk import interrupted.")
+            pool.shutdown(wait=False)
+            if LOCAL_CLASSIFIER:
+                save_local_classifiers()
+            exit(1)
+        pool.shutdown()
+        get_extraction_pool().shutdown()
+        if LOCAL_CLASSIFIER:
+            save_local_classifiers()
+        logging.info("Exiting.")
+        exit(0)
+
+    event_handler = PDFHandler(pool)
     observer = Observer()
-    observer.schedule(event_handler, INPUT_DIR, recursive=False) # Monitor only top-level
+    for source in sources:
+        observer.schedule(event_handler, source.input_dir, recursive=True) # Subfolders too, e.g. one per department
     observer.start()
     logging.info("Observer started.")
 
+    stop_event = threading.Event()
+    threading.Thread(target=run_retry_scheduler, args=(pool, stop_event), name="retry-scheduler", daemon=True).start()
+
+    if STARTUP_SCAN:
+        # Start watching first so nothing dropped during the scan is missed; duplicates are skipped by the pool
+        threading.Thread(target=lambda: process_backlog(pool, scan_sources(sources)),
+                         name="startup-scan", daemon=True).start()
+
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
+        stop_event.set()
         logging.info("Observer stopped.")
+        if LOCAL_CLASSIFIER:
+            save_local_classifiers() # Now, in case in-flight documents outlast docker stop's grace period
     observer.join()
+    pool.shutdown()
+    get_extraction_pool().shutdown()
+    if LOCAL_CLASSIFIER:
+        save_local_classifiers()
     logging.info("Exiting.")
@@ -0,0 +1,140 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+
+# Maximum characters of extracted text sent to text-only backends
+MAX_PROMPT_TEXT_CHARS = 12000
+
+
+class GeminiBackend:
+    """Sends the first pages as inline PDF data to Gemini. The SDK is imported on first use."""
+
+    name = 'gemini'
+    wants_thumbnail = False # The PDF data is sent as is
+
+    def __init__(self, api_key, model_name="gemini-2.0-flash"):
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set.")
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+        self._types = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                from google.generativeai import types # Added for inline data
+
+                genai.configure(api_key=self.api_key) # Configure the Gemini client
+                generation_config = {
+                    "temperature": 0.7, # Controls randomness (higher = more creative)
+                    "top_p": 1,         # Nucleus sampling parameter
+                    "top_k": 1,         # Top-k sampling parameter
+                    "max_output_tokens": 2048, # Maximum length of the response
+                    "response_mime_type": "application/json", # Expect JSON output from the model
+                }
+                self._model = genai.GenerativeModel(model_name=self.model_name, # Specify the Gemini model
+                                                    generation_config=generation_config)
+                self._types = types
+        return self._model
+
+    def classify(self, prompt, pdf_bytes, text, thumbnail_png=None):
+        """Returns the raw JSON text of the model's answer."""
+        model = self._get_model()
+        # Send PDF bytes inline along with the prompt
+        response = model.generate_content([
+            self._types.Part.from_bytes(data=pdf_bytes, mime_type='application/pdf'),
+            prompt
+        ])
+        # Accessing the JSON content correctly based on google-generativeai SDK
+        if not response.parts:
+            raise ValueError(f"Gemini response format unexpected or empty: {response}")
+        # Assuming the first part contains the JSON text if mime_type is application/json
+        return response.parts[0].text
+
+
+class OllamaBackend:
+    """Asks a local Ollama model, passing the extracted text since it can't read PDF data.
+
+    Vision models can additionally get a thumbnail of the first page (send_thumbnail).
+    """
+
+    name = 'ollama'
+
+    def __init__(self, url, model_name, timeout=300, send_thumbnail=False):
+        self.url = url.rstrip('/')
+        self.model_name = model_name
+        self.timeout = timeout
+        self.wants_thumbnail = send_thumbnail
+
+    def classify(self, prompt, pdf_bytes, text, thumbnail_png=None):
+        """Returns the raw JSON text of the model's answer."""
+        payload = {
+            "model": self.model_name,
+            "prompt": f"{prompt}\nExtracted text of the PDF data:\n{text[:MAX_PROMPT_TEXT_CHARS]}",
+            "format": "json",
+            "stream": False,
+            "options": {"temperature": 0.7},
+        }
+        if self.wants_thumbnail and thumbnail_png:
+            payload["images"] = [base64.b64encode(thumbnail_png).decode('ascii')]
+        request = urllib.request.Request(
+            f"{self.url}/api/generate",
+            data=json.dumps(payload).encode('utf-8'),
+            headers={"Content-Type": "application/json"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            body = json.load(response)
+        return body.get("response", "")
+
+
+class StubBackend:
+    """Offline backend for tests and load testing: sleeps, then derives a path from the text hash."""
+
+    name = 'stub'
+    wants_thumbnail = False
+    CATEGORIES = ["Finance/Invoices", "Finance/Statements", "Research/Papers", "Manuals/Hardware", "Personal/Letters"]
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def classify(self, prompt, pdf_bytes, text, thumbnail_png=None):
+        """Returns a deterministic JSON answer after the configured latency."""
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha256((text or '').encode('utf-8') or pdf_bytes).hexdigest()
+        category = self.CATEGORIES[int(digest[:8], 16) % len(self.CATEGORIES)]
+        return json.dumps({"path": f"{category}/Document_{digest[:12]}.pdf"})
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def create_backend(name):
+    """Creates a backend from its name and environment configuration."""
+    if name == 'gemini':
+        return GeminiBackend(os.getenv('GEMINI_API_KEY'), os.getenv('GEMINI_MODEL', "gemini-2.0-flash"))
+    if name == 'ollama':
+        return OllamaBackend(os.getenv('OLLAMA_URL', "http://ollama:11434"), os.getenv('OLLAMA_MODEL', "llama3.2"),
+                             timeout=float(os.getenv('OLLAMA_TIMEOUT', 300)),
+                             send_thumbnail=os.getenv('OLLAMA_SEND_THUMBNAIL', 'false').lower() == 'true')
+    if name == 'stub':
+        return StubBackend(latency=float(os.getenv('STUB_LATENCY', 0)))
+    raise ValueError(f"Unknown LLM backend '{name}' (expected gemini, ollama or stub).")
+
+
+def get_backend(name):
+    """Returns the shared backend instance for a name, creating it on first use."""
+    with _backends_lock:
+        if name not in _backends:
+            _backends[name] = create_backend(name)
+            logging.info(f"Initialized '{name}' LLM backend.")
+        return _backends[name]
@@ -0,0 +1,126 @@
+"""Benchmark peak RSS of first-pages extraction on large synthetic scanned PDFs.
+
+Compares the original approach (insert_pdf of the full pages, then tobytes) with the
+memory-bounded build_excerpt from extraction.py. Generation and each run happen in their own
+subprocess, because Linux keeps ru_maxrss across fork/exec.
+
+Example:
+    python bench_extraction.py --pages 5 --width 7000 --height 9900 --concurrency 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+
+
+def make_scanned_pdf(path, pages, width, height, image_format):
+    """Writes a PDF whose pages each hold one large 'scan' (JPEG, or lossless PNG which stays much larger)."""
+    import numpy as np
+
+    y, x = np.mgrid[0:height, 0:width]
+    rng = np.random.default_rng(0)
+    doc = fitz.open()
+    for page_number in range(pages):
+        # Smooth gradient plus light noise: compresses like a real scan but decodes to full size
+        gray = ((x + y * (page_number + 1)) % 256).astype(np.uint8)
+        gray = np.clip(gray.astype(np.int16) + rng.integers(-8, 8, gray.shape), 0, 255).astype(np.uint8)
+        samples = np.repeat(gray[:, :, None], 3, axis=2).tobytes()
+        pix = fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+        page = doc.new_page(width=595, height=842) # A4 in points
+        data = pix.tobytes('jpeg', jpg_quality=85) if image_format == 'jpeg' else pix.tobytes('png')
+        page.insert_image(page.rect, stream=data)
+        pix = None
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def naive_excerpt(pdf_path, pages_to_analyze):
+    """The original organize_pdf extraction."""
+    original_doc = fitz.open(pdf_path)
+    pages_to_read = min(pages_to_analyze, len(original_doc))
+    temp_doc = fitz.open()
+    temp_doc.insert_pdf(original_doc, from_page=0, to_page=pages_to_read - 1)
+    pdf_bytes = temp_doc.tobytes()
+    temp_doc.close()
+    original_doc.close()
+    return pdf_bytes
+
+
+def run_single(mode, pdf_path, pages, concurrency, budget_mb):
+    """Runs one measurement in this process and prints a JSON result."""
+    from extraction import MemoryBudget, build_excerpt, estimate_excerpt_cost
+
+    budget = MemoryBudget(budget_mb * 1024 * 1024)
+
+    def extract(_):
+        if mode == 'naive':
+            return len(naive_excerpt(pdf_path, pages))
+        reserved = budget.acquire(estimate_excerpt_cost(pdf_path, pages, 2000, 15 * 1024 * 1024))
+        try:
+            return len(build_excerpt(pdf_path, pages).pdf_bytes)
+        finally:
+            budget.release(reserved)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        sizes = list(executor.map(extract, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # kilobytes on Linux
+    print(json.dumps({"mode": mode, "seconds": elapsed, "peak_rss_mb": peak_rss_mb, "excerpt_bytes": sizes[0]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure peak RSS of PDF first-pages extraction.")
+    parser.add_argument("--pages", type=int, default=3, help="Pages to analyze (default: 3).")
+    parser.add_argument("--total-pages", type=int, default=10, help="Pages in the synthetic PDF (default: 10).")
+    parser.add_argument("--width", type=int, default=5000, help="Scan width in pixels (default: 5000).")
+    parser.add_argument("--height", type=int, default=7000, help="Scan height in pixels (default: 7000).")
+    parser.add_argument("--format", choices=["png", "jpeg"], default="png", help="Scan encoding (default: png).")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel extractions (default: 4).")
+    parser.add_argument("--budget-mb", type=int, default=1024, help="Memory budget for the bounded mode (default: 1024).")
+    parser.add_argument("--pdf", help="Use an existing PDF instead of generating one.")
+    parser.add_argument("--run", choices=["naive", "bounded"], help=argparse.SUPPRESS) # Internal: child process
+    parser.add_argument("--generate", action="store_true", help=argparse.SUPPRESS) # Internal: child process
+    args = parser.parse_args()
+
+    if args.run:
+        run_single(args.run, args.pdf, args.pages, args.concurrency, args.budget_mb)
+        return
+    if args.generate:
+        make_scanned_pdf(args.pdf, args.total_pages, args.width, args.height, args.format)
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(tmpdir, "synthetic.pdf")
+            print(f"Generating {args.total_pages}-page PDF with {args.width}x{args.height} {args.format} scans...")
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--generate", "--pdf", pdf_path,
+                 "--total-pages", str(args.total_pages), "--width", str(args.width), "--height", str(args.height),
+                 "--format", args.format],
+                check=True,
+            )
+        print(f"PDF size: {os.path.getsize(pdf_path) / 1024 / 1024:.1f} MiB, "
+              f"{args.concurrency} concurrent extraction(s) of {args.pages} page(s)")
+        for mode in ("naive", "bounded"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", mode, "--pdf", pdf_path,
+                 "--pages", str(args.pages), "--concurrency", str(args.concurrency),
+                 "--budget-mb", str(args.budget_mb)],
+                check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:>8}: peak RSS {result['peak_rss_mb']:8.1f} MiB, {result['seconds']:6.2f}s, "
+                  f"excerpt {result['excerpt_bytes'] / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Read files in 1 MiB chunks when hashing
+
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file's raw bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text):
+    """Returns a SHA-256 hex digest of whitespace/case-normalized text, or None if there is no text."""
+    normalized = re.sub(r'\s+', ' ', text or '').strip().lower()
+    if not normalized:
+        return None  # Scanned PDFs without a text layer can't be matched on text
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class DocumentIndex:
+    """Persistent SQLite index from content hash and first-pages text hash to the filed destination path."""
+
+    def __init__(self, db_path):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # One shared connection guarded by a lock; watcher callbacks may come from several threads
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                       content_hash TEXT PRIMARY KEY,
+                       text_hash TEXT,
+                       dest_path TEXT NOT NULL,
+                       filed_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS documents_text_hash ON documents (text_hash)")
+
+    def lookup_content(self, content_hash):
+        """Returns the destination path of a byte-identical document, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dest_path FROM documents WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def lookup_text(self, text_hash):
+        """Returns the most recent destination path of a document with the same first-pages text, or None."""
+        if not text_hash:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dest_path FROM documents WHERE text_hash = ? ORDER BY filed_at DESC LIMIT 1", (text_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, content_hash, text_hash, dest_path):
+        """Stores (or refreshes) the destination chosen for a document."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (content_hash, text_hash, dest_path, filed_at) VALUES (?, ?, ?, ?)",
+                (content_hash, text_hash, dest_path, time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
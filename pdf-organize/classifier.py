@@ -0,0 +1,225 @@
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r'[^\W\d_]{3,}') # Words of 3+ letters; numbers and dates are too document-specific
+IDF_REFRESH_GROWTH = 1.1 # Recompute IDF weights once the index has grown by 10%
+
+Prediction = namedtuple('Prediction', ['label', 'similarity', 'agreement'])
+
+
+class LocalClassifier:
+    """Nearest-neighbour folder classifier over hashed TF-IDF vectors of first-page text.
+
+    Each filed PDF is one row labelled with its folder relative to the output directory.
+    Vectors are stored raw (sublinear term frequencies) so IDF weights can change as the
+    index grows; cosine similarity is computed against only the query's non-zero features.
+    """
+
+    def __init__(self, index_path, n_features=4096, k=5, save_every=25):
+        self.index_path = index_path
+        self.n_features = n_features
+        self.k = k
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((64, n_features), dtype=np.float32) # Grown by doubling
+        self._count = 0
+        self._labels = []
+        self._doc_freq = np.zeros(n_features, dtype=np.float64)
+        self._idf = np.ones(n_features, dtype=np.float64)
+        self._norms = np.zeros(64, dtype=np.float64)
+        self._idf_count = 0 # Document count the current IDF weights were computed for
+        self._unsaved = 0
+        self.seeded = False # Whether the index was built from every organized PDF, see seed()
+        self._seeding = False
+        self._pending = [] # Documents filed while seeding: (key, vector, label)
+        self._load()
+
+    def __len__(self):
+        return self._count
+
+    def vectorize(self, text):
+        """Returns the hashed, sublinear term-frequency vector of a text."""
+        tokens = TOKEN_PATTERN.findall((text or '').lower())
+        if not tokens:
+            return np.zeros(self.n_features, dtype=np.float32)
+        buckets = np.fromiter((zlib.crc32(t.encode('utf-8')) for t in tokens), dtype=np.uint32, count=len(tokens))
+        counts = np.bincount(buckets % self.n_features, minlength=self.n_features)
+        return np.log1p(counts).astype(np.float32)
+
+    def add(self, text, label, autosave=True, key=None):
+        """Adds a filed document to the index. Empty texts are ignored.
+
+        While seed() runs, the document is held back and added when seeding ends, unless seeding
+        found it under the same key (its path) already.
+        """
+        vector = self.vectorize(text)
+        if not vector.any():
+            return
+        with self._lock:
+            if self._seeding:
+                self._pending.append((key, vector, label))
+                return
+            self._append(vector, label)
+            if self._count >= self._idf_count * IDF_REFRESH_GROWTH:
+                self._refresh_idf()
+            else:
+                self._norms[self._count - 1] = self._weighted_norm(vector)
+            self._unsaved += 1
+            should_save = autosave and self._unsaved >= self.save_every
+        if should_save:
+            self.save()
+
+    def seed(self, documents):
+        """Replaces the index with documents, an iterable of (key, text, label) for every organized PDF.
+
+        Documents added meanwhile are held back, so no half-seeded index is saved, and are added
+        afterwards unless documents included them. The index is then marked seeded and saved.
+        Only the iteration happens while seeding, so a lazy iterable should list the PDFs itself.
+        Returns the number of documents indexed from documents.
+        """
+        with self._lock:
+            self._seeding = True
+        rows = None
+        try:
+            keys = set()
+            vectors = np.zeros((64, self.n_features), dtype=np.float32)
+            labels = []
+            for key, text, label in documents:
+                keys.add(key)
+                vector = self.vectorize(text)
+                if not vector.any():
+                    continue
+                if len(labels) == len(vectors):
+                    grown = np.zeros((len(vectors) * 2, self.n_features), dtype=np.float32)
+                    grown[:len(labels)] = vectors[:len(labels)]
+                    vectors = grown
+                vectors[len(labels)] = vector
+                labels.append(label)
+            rows = (vectors, labels)
+        finally:
+            with self._lock:
+                if rows is not None:
+                    self._vectors, self._labels = rows
+                    self._count = seeded_count = len(self._labels)
+                    self._norms = np.zeros(len(self._vectors), dtype=np.float64)
+                    self._doc_freq = (self._vectors[:self._count] > 0).sum(axis=0).astype(np.float64)
+                    self.seeded = True
+                    pending = [(vector, label) for key, vector, label in self._pending if key is None or key not in keys]
+                else:
+                    pending = [(vector, label) for _, vector, label in self._pending]
+                for vector, label in pending:
+                    self._append(vector, label)
+                self._pending = []
+                self._seeding = False
+                self._refresh_idf()
+        self.save()
+        return seeded_count
+
+    def predict(self, text):
+        """Returns the best matching folder as a Prediction, or None if the index can't tell.
+
+        similarity is the best cosine similarity among neighbours with that label, agreement the
+        share of the k nearest neighbours' similarity mass that voted for it.
+        """
+        query = self.vectorize(text)
+        features = np.flatnonzero(query)
+        if not len(features):
+            return None
+        with self._lock:
+            if not self._count:
+                return None
+            weights = self._idf[features]
+            weighted_query = query[features] * weights
+            query_norm = np.linalg.norm(weighted_query)
+            # (V * idf) . (q * idf) only touches the query's features
+            dots = self._vectors[:self._count, features] @ (weighted_query * weights)
+            similarities = dots / (self._norms[:self._count] * query_norm + 1e-12)
+            k = min(self.k, self._count)
+            nearest = np.argpartition(-similarities, k - 1)[:k]
+            votes = {}
+            best = {}
+            for row in nearest:
+                label = self._labels[row]
+                score = float(max(similarities[row], 0.0))
+                votes[label] = votes.get(label, 0.0) + score
+                best[label] = max(best.get(label, 0.0), score)
+        total = sum(votes.values())
+        if total <= 0:
+            return None
+        label = max(votes, key=votes.get)
+        return Prediction(label, best[label], votes[label] / total)
+
+    def save(self):
+        """Writes the index atomically next to its final location."""
+        with self._lock:
+            vectors = self._vectors[:self._count].copy()
+            labels = np.array(self._labels, dtype=str)
+            doc_freq = self._doc_freq.copy()
+            seeded = self.seeded
+            self._unsaved = 0
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(f, vectors=vectors, labels=labels, doc_freq=doc_freq, seeded=seeded)
+        os.replace(temp_path, self.index_path)
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with np.load(self.index_path) as data:
+                vectors = data['vectors']
+                labels = [str(label) for label in data['labels']]
+                doc_freq = data['doc_freq']
+                seeded = bool(data['seeded']) if 'seeded' in data.files else False # Older indexes are seeded again
+        except Exception as e:
+            logging.warning(f"Could not load classifier index {self.index_path}, starting empty: {e}")
+            return
+        if vectors.shape[1] != self.n_features:
+            logging.warning(f"Classifier index {self.index_path} uses {vectors.shape[1]} features, "
+                            f"expected {self.n_features}; starting empty.")
+            return
+        capacity = max(64, len(vectors))
+        self._vectors = np.zeros((capacity, self.n_features), dtype=np.float32)
+        self._vectors[:len(vectors)] = vectors
+        self._norms = np.zeros(capacity, dtype=np.float64)
+        self._labels = labels
+        self._doc_freq = doc_freq.astype(np.float64)
+        self._count = len(vectors)
+        self.seeded = seeded
+        self._refresh_idf()
+        logging.info(f"Loaded classifier index with {self._count} document(s) from {self.index_path}")
+
+    def _append(self, vector, label):
+        """Stores one row; the caller holds the lock and updates its norm."""
+        if self._count == len(self._vectors):
+            self._grow()
+        self._vectors[self._count] = vector
+        self._labels.append(label)
+        self._doc_freq += vector > 0
+        self._count += 1
+
+    def _grow(self):
+        capacity = len(self._vectors) * 2
+        vectors = np.zeros((capacity, self.n_features), dtype=np.float32)
+        vectors[:self._count] = self._vectors[:self._count]
+        norms = np.zeros(capacity, dtype=np.float64)
+        norms[:self._count] = self._norms[:self._count]
+        self._vectors, self._norms = vectors, norms
+
+    def _weighted_norm(self, vector):
+        return float(np.linalg.norm(vector * self._idf))
+
+    def _refresh_idf(self, chunk_size=4096):
+        """Recomputes smoothed IDF weights and every row's weighted norm, in chunks to bound memory."""
+        self._idf = np.log((1 + self._count) / (1 + self._doc_freq)) + 1
+        squared_idf = self._idf ** 2
+        for start in range(0, self._count, chunk_size):
+            chunk = self._vectors[start:min(start + chunk_size, self._count)]
+            self._norms[start:start + len(chunk)] = np.sqrt((chunk.astype(np.float64) ** 2) @ squared_idf)
+        self._idf_count = self._count
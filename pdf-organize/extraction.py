@@ -0,0 +1,124 @@
+import os
+import threading
+from collections import namedtuple
+
+import fitz  # PyMuPDF
+
+# Bytes per pixel for the colorspaces PyMuPDF reports in Page.get_images()
+COLORSPACE_COMPONENTS = {'DeviceGray': 1, 'DeviceRGB': 3, 'DeviceCMYK': 4}
+BASE_EXTRACTION_COST = 16 * 1024 * 1024 # Fixed overhead per open document and output buffer
+
+# Compact results returned from extraction worker processes
+DocumentText = namedtuple('DocumentText', ['metadata', 'page_count', 'page_texts'])
+Excerpt = namedtuple('Excerpt', ['pdf_bytes', 'thumbnail_png'])
+
+
+class MemoryBudget:
+    """Byte-counting semaphore limiting how much memory concurrent extractions may use.
+
+    A reservation larger than the whole budget is clamped to it, so an oversized document
+    still runs, just alone.
+    """
+
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, amount):
+        """Blocks until amount bytes fit in the budget and returns the amount actually reserved."""
+        amount = min(amount, self.limit)
+        with self._condition:
+            while self.used + amount > self.limit:
+                self._condition.wait()
+            self.used += amount
+        return amount
+
+    def release(self, amount):
+        with self._condition:
+            self.used -= amount
+            self._condition.notify_all()
+
+
+def available_cpus():
+    """Returns the number of cores this process may run on (honouring container CPU sets on Linux)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def read_text(pdf_path, pages_to_analyze):
+    """Returns metadata and the text of the first pages.
+
+    Opening by path lets MuPDF seek to the objects it needs on demand (like a memory-mapped
+    file), so only the xref table and the requested pages' content streams are read.
+    """
+    with fitz.open(pdf_path) as doc:
+        pages_to_read = min(pages_to_analyze, len(doc))
+        return DocumentText(doc.metadata, len(doc), [doc[i].get_text() for i in range(pages_to_read)])
+
+
+def read_first_page_text(pdf_path):
+    """Returns the first page's text, or None if the file can't be read. Used for bulk indexing."""
+    try:
+        with fitz.open(pdf_path) as doc:
+            return doc[0].get_text() if len(doc) else ''
+    except Exception:
+        return None
+
+
+def _image_streams(page):
+    """Yields (width, height, components, compressed_bytes) per image on a page, without decoding it."""
+    doc = page.parent
+    for image in page.get_images(full=True):
+        # (xref, smask, width, height, bpc, colorspace, alt. colorspace, name, filter, referencer)
+        xref, width, height = image[0], image[2], image[3]
+        length = doc.xref_get_key(xref, "Length")
+        compressed = int(length[1]) if length[0] == 'int' else width * height
+        yield width, height, COLORSPACE_COMPONENTS.get(image[5], 3), compressed
+
+
+def _page_images(doc, pages_to_read):
+    return [image for i in range(pages_to_read) for image in _image_streams(doc[i])]
+
+
+def _needs_downsampling(images, max_image_dim, max_excerpt_bytes):
+    """Images are only recompressed when the excerpt would be too large to send as is."""
+    compressed = sum(image[3] for image in images)
+    return compressed > max_excerpt_bytes and any(max(width, height) > max_image_dim for width, height, _, _ in images)
+
+
+def estimate_excerpt_cost(pdf_path, pages_to_analyze, max_image_dim, max_excerpt_bytes):
+    """Estimates peak bytes needed by build_excerpt from image headers, without decoding anything.
+
+    Copied pages cost their compressed image data twice (excerpt document and serialized bytes).
+    Downsampling decodes oversized images one at a time, so only the largest one counts in full.
+    """
+    with fitz.open(pdf_path) as doc:
+        images = _page_images(doc, min(pages_to_analyze, len(doc)))
+    cost = BASE_EXTRACTION_COST + 2 * sum(image[3] for image in images)
+    if _needs_downsampling(images, max_image_dim, max_excerpt_bytes):
+        cost += max(width * height * components for width, height, components, _ in images)
+    return cost
+
+
+def build_excerpt(pdf_path, pages_to_analyze, max_image_dim=2000, max_excerpt_bytes=15 * 1024 * 1024, dpi=150,
+                  thumbnail_dpi=0):
+    """Returns an Excerpt: the first pages as a standalone PDF small enough to send inline, and
+    optionally a PNG thumbnail of the first page rendered at thumbnail_dpi.
+
+    Only the requested pages are copied, with their image streams still compressed. If the
+    images add up to more than max_excerpt_bytes, images placed above dpi are recompressed down
+    to dpi. Older PyMuPDF versions without Document.rewrite_images send the images unchanged.
+    """
+    with fitz.open(pdf_path) as src, fitz.open() as excerpt:
+        thumbnail_png = None
+        if thumbnail_dpi and len(src):
+            thumbnail_png = src[0].get_pixmap(dpi=thumbnail_dpi).tobytes('png')
+        pages_to_read = min(pages_to_analyze, len(src))
+        downsample = _needs_downsampling(_page_images(src, pages_to_read), max_image_dim, max_excerpt_bytes)
+        excerpt.insert_pdf(src, from_page=0, to_page=pages_to_read - 1)
+        if downsample and hasattr(excerpt, 'rewrite_images'):
+            excerpt.rewrite_images(dpi_threshold=dpi + dpi // 2, dpi_target=dpi, quality=75)
+        # garbage=3 drops replaced image streams and deduplicates shared resources
+        return Excerpt(excerpt.tobytes(garbage=3, deflate=True), thumbnail_png)
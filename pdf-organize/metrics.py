@@ -0,0 +1,168 @@
+import json
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets in seconds, from a cache lookup up to a slow LLM call on a huge scan
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms rendered in Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._values = {} # (name, labels) -> value, for counters and gauges
+        self._histograms = {} # (name, labels) -> [bucket counts..., sum, count]
+
+    def describe(self, name, metric_type, help_text):
+        self._types[name] = metric_type
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+        lines = []
+        for name in sorted({key[0] for key in list(values) + list(histograms)}):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {self._types[name]}")
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-2]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+metrics.describe('pdf_organizer_documents_processed_total', 'counter', 'PDFs organized, by route taken.')
+metrics.describe('pdf_organizer_documents_failed_total', 'counter', 'PDFs whose processing failed.')
+metrics.describe('pdf_organizer_cache_hits_total', 'counter', 'Documents routed from the document index, by kind.')
+metrics.describe('pdf_organizer_retries_total', 'counter', 'Processing attempts scheduled for retry.')
+metrics.describe('pdf_organizer_dead_letters_total', 'counter', 'PDFs moved to the dead-letter folder after exhausting retries.')
+metrics.describe('pdf_organizer_queue_depth', 'gauge', 'PDFs queued or running on the worker pool.')
+metrics.describe('pdf_organizer_stage_seconds', 'histogram', 'Time spent per processing stage.')
+metrics.describe('pdf_organizer_document_seconds', 'histogram', 'End-to-end processing time per PDF.')
+
+trace_logger = logging.getLogger('pdf_organizer.trace')
+trace_logger.propagate = False # Keep JSON lines out of the human-readable log
+
+
+def configure_trace_log(path):
+    """Writes one JSON object per processed document to path ('-' for stdout)."""
+    handler = logging.StreamHandler(sys.stdout) if path == '-' else logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.INFO)
+
+
+class DocumentTrace:
+    """Collects per-stage timings for one PDF and reports them when the document is finished."""
+
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.spans = {}
+        self.status = None
+        self.fields = {}
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.spans[stage] = self.spans.get(stage, 0.0) + duration
+            metrics.observe('pdf_organizer_stage_seconds', duration, stage=stage)
+
+    def finish(self, status, **fields):
+        """Records the outcome ('filed', 'duplicate', 'failed', ...) and emits the JSON trace line."""
+        duration = time.perf_counter() - self._start
+        self.status = status
+        self.fields = fields
+        metrics.observe('pdf_organizer_document_seconds', duration)
+        if status == 'failed':
+            metrics.inc('pdf_organizer_documents_failed_total')
+        else:
+            metrics.inc('pdf_organizer_documents_processed_total', route=status)
+        if trace_logger.handlers:
+            record = {
+                "timestamp": self.started,
+                "file": self.pdf_path,
+                "status": status,
+                "duration_seconds": round(duration, 6),
+                "spans": {stage: round(seconds, 6) for stage, seconds in self.spans.items()},
+                **fields,
+            }
+            trace_logger.info(json.dumps(record))
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes would otherwise flood the log
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Serves /metrics on a daemon thread and returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,91 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+class RetryQueue:
+    """Persistent queue of failed PDFs with exponential backoff, stored in SQLite.
+
+    A row exists while a file is waiting for another attempt. Once max_attempts is reached the
+    row is removed and the caller is told to give up (dead-letter the file).
+    """
+
+    def __init__(self, db_path, base_delay=30, max_delay=3600, max_attempts=5):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS retries (
+                       pdf_path TEXT PRIMARY KEY,
+                       attempts INTEGER NOT NULL,
+                       next_attempt REAL NOT NULL,
+                       llm_error INTEGER NOT NULL,
+                       last_error TEXT
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS retries_next_attempt ON retries (next_attempt)")
+
+    def record_failure(self, pdf_path, error, llm_error=False):
+        """Registers a failed attempt. Returns (attempts, delay); delay is None once attempts are exhausted."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT attempts FROM retries WHERE pdf_path = ?", (pdf_path,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            if attempts >= self.max_attempts:
+                self._conn.execute("DELETE FROM retries WHERE pdf_path = ?", (pdf_path,))
+                return attempts, None
+            # Exponential backoff with +-10% jitter so a burst of failures doesn't retry in lockstep
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.9, 1.1)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO retries (pdf_path, attempts, next_attempt, llm_error, last_error) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (pdf_path, attempts, time.time() + delay, int(llm_error), error),
+            )
+            return attempts, delay
+
+    def clear(self, pdf_path):
+        """Forgets a file, e.g. after it was processed successfully or removed."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM retries WHERE pdf_path = ?", (pdf_path,))
+
+    def due(self, now=None):
+        """Returns the paths whose next attempt is due."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT pdf_path FROM retries WHERE next_attempt <= ? ORDER BY next_attempt",
+                (now if now is not None else time.time(),),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def next_due_in(self):
+        """Returns seconds until the next attempt is due (0 if overdue), or None if the queue is empty."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt) FROM retries").fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def expedite_llm_errors(self):
+        """Makes every file that failed in the LLM stage due now. Returns how many were expedited."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE retries SET next_attempt = ? WHERE llm_error = 1 AND next_attempt > ?",
+                (time.time(), time.time()),
+            )
+            return cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM retries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,77 @@
+import json
+import os
+from collections import namedtuple
+
+CLASSIFIER_INDEX_NAME = '.pdf_organizer_classifier.npz'
+DEAD_LETTER_NAME = '.failed'
+
+# One watched input root and the rules for the PDFs dropped into it (or any of its subfolders)
+Source = namedtuple('Source', ['input_dir', 'output_dir', 'pages_to_analyze', 'backend', 'share',
+                               'dead_letter_dir', 'classifier_index'])
+
+
+def make_source(input_dir, output_dir, pages_to_analyze, backend, share=1, dead_letter_dir=None, classifier_index=None):
+    """Builds a Source, placing the dead-letter folder and classifier index inside its roots by default."""
+    input_dir = os.path.abspath(input_dir)
+    output_dir = os.path.abspath(output_dir)
+    if share <= 0:
+        raise ValueError(f"Concurrency share of {input_dir} must be positive, got {share}.")
+    return Source(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        pages_to_analyze=int(pages_to_analyze),
+        backend=backend.lower(),
+        share=float(share),
+        dead_letter_dir=dead_letter_dir or os.path.join(input_dir, DEAD_LETTER_NAME),
+        classifier_index=classifier_index or os.path.join(output_dir, CLASSIFIER_INDEX_NAME),
+    )
+
+
+def load_sources(config_path, default):
+    """Reads the watched roots from a JSON file.
+
+    The file holds a list of objects (or {"roots": [...]}) with an "input" path and optionally
+    "output", "pages_to_analyze", "backend" and "share"; missing keys are taken from default.
+    """
+    with open(config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    entries = config.get('roots') if isinstance(config, dict) else config
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{config_path} must contain a non-empty list of roots.")
+    sources = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get('input'):
+            raise ValueError(f"Every root in {config_path} needs an 'input' path: {entry}")
+        sources.append(make_source(
+            entry['input'],
+            entry.get('output', default.output_dir),
+            entry.get('pages_to_analyze', default.pages_to_analyze),
+            entry.get('backend', default.backend),
+            share=entry.get('share', 1),
+            dead_letter_dir=entry.get('dead_letter_dir'),
+        ))
+    input_dirs = [source.input_dir for source in sources]
+    if len(set(input_dirs)) != len(input_dirs):
+        raise ValueError(f"{config_path} lists the same input directory more than once.")
+    return sources
+
+
+def find_source(sources, path):
+    """Returns the source whose input root contains path (the innermost one if roots are nested).
+
+    Files inside hidden folders of a root, such as the .failed dead-letter folder, belong to no source.
+    """
+    path = os.path.abspath(path)
+    best = None
+    for source in sources:
+        relative = os.path.relpath(path, source.input_dir)
+        if relative == os.curdir or relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+            continue
+        if best is None or len(source.input_dir) > len(best.input_dir):
+            best = source
+    if best is None:
+        return None
+    folders = os.path.relpath(os.path.dirname(path), best.input_dir).split(os.sep)
+    if any(folder.startswith('.') and folder != os.curdir for folder in folders):
+        return None
+    return best
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from engine import synthesize
+from streaming import SENTENCE_PAUSE_SECONDS
+from text_split import split_sentences
+
+DEFAULT_CACHE_MAX_MB = 500
+FINGERPRINTS_FILE = 'fingerprints.json' # Model file hashes, so large files are hashed once
+SAMPLE_RATE = 24000 # Kokoro's output rate; segments are stored as bare samples
+
+
+def normalize_text(text):
+    """Collapses whitespace so reflowed text maps to the same cache entry."""
+    return ' '.join(text.split())
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AudioCache:
+    """On-disk cache of synthesized sentences, addressed by content.
+
+    Each sentence is stored as a .npy file named by the hash of its normalized text, voice,
+    language, speed and the model and voices files, so a new model never serves stale audio.
+    Reading an entry refreshes its mtime; when the cache grows past max_bytes, the least
+    recently used entries are deleted. Several processes may share one cache directory.
+    """
+
+    def __init__(self, cache_dir, model_path, voices_path, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.model_hash = hashlib.sha256(
+            (self._fingerprint(model_path) + self._fingerprint(voices_path)).encode()).hexdigest()
+        self._lock = threading.Lock()
+        self._size = None # Estimated total size, recounted on eviction
+        self.hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # Sent to worker processes, which get their own lock and counters
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, path):
+        """sha256 of a file, remembered by path, size and mtime in the cache directory."""
+        stat = os.stat(path)
+        index_path = os.path.join(self.cache_dir, FINGERPRINTS_FILE)
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        entry = index.get(os.path.abspath(path))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+        sha256 = file_sha256(path)
+        index[os.path.abspath(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        partial_path = f"{index_path}.{os.getpid()}.part"
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(partial_path, index_path)
+        return sha256
+
+    def key(self, text, voice, lang, speed):
+        fields = [normalize_text(text), voice, lang, f"{float(speed):g}", self.model_hash]
+        return hashlib.sha256('\0'.join(fields).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def get(self, key):
+        """Returns the cached samples for key, or None."""
+        path = self._path(key)
+        try:
+            samples = np.load(path)
+            os.utime(path) # Marks the entry as recently used
+        except (OSError, ValueError):
+            return None
+        return samples
+
+    def put(self, key, samples):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # np.save appends .npy unless the name already ends with it
+        partial_path = f"{path[:-4]}.{os.getpid()}.{threading.get_ident()}.part.npy"
+        np.save(partial_path, np.asarray(samples, dtype=np.float32))
+        os.replace(partial_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self.total_bytes()
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._size = self.evict()
+
+    def _entries(self):
+        """(mtime, size, path) of every cached segment."""
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith('.npy') and '.part' not in entry.name:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue # Evicted by another process
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Deletes least recently used segments until the cache fits in max_bytes; returns the new size."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def synthesize(self, kokoro, text, voice, lang, speed):
+        """Returns (samples, sample_rate) for text, synthesizing only the sentences not cached yet.
+
+        Sentences are joined with the same pause as streaming mode, so editing one paragraph of
+        a long text re-synthesizes just the changed sentences.
+        """
+        segments = []
+        for sentence in split_sentences(text):
+            key = self.key(sentence, voice, lang, speed)
+            samples = self.get(key)
+            if samples is None:
+                samples, sample_rate = synthesize(kokoro, sentence, voice, lang, speed)
+                if sample_rate != SAMPLE_RATE:
+                    raise ValueError(f"Unexpected sample rate {sample_rate} (the cache stores {SAMPLE_RATE} Hz audio).")
+                self.put(key, samples)
+                with self._lock:
+                    self.misses += 1
+            else:
+                with self._lock:
+                    self.hits += 1
+            if segments:
+                segments.append(np.zeros(int(SENTENCE_PAUSE_SECONDS * SAMPLE_RATE), dtype=np.float32))
+            segments.append(samples.astype(np.float32, copy=False))
+        if not segments:
+            raise ValueError("Nothing to synthesize: the text is empty.")
+        return np.concatenate(segments), SAMPLE_RATE
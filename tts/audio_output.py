@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+# Output format name (also the file extension) -> (soundfile format, subtype)
+OUTPUT_FORMATS = {
+    'wav': ('WAV', 'PCM_16'),
+    'flac': ('FLAC', 'PCM_16'),
+    'ogg': ('OGG', 'VORBIS'),
+    'opus': ('OGG', 'OPUS'), # Opus supports 8, 12, 16, 24 and 48 kHz only
+    'mp3': ('MP3', 'MPEG_LAYER_III'), # Needs libsndfile 1.1 or newer
+}
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def output_format(path):
+    """Returns (soundfile format, subtype) for an output path, chosen by its extension."""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '.{extension}' (expected {', '.join(OUTPUT_FORMATS)}).")
+    sf_format, subtype = OUTPUT_FORMATS[extension]
+    if sf_format not in sf.available_formats() or subtype not in sf.available_subtypes(sf_format):
+        raise ValueError(f"This libsndfile ({sf.__libsndfile_version__}) can't write {extension} files.")
+    return sf_format, subtype
+
+
+class StreamResampler:
+    """Converts the sample rate of audio that arrives in chunks.
+
+    A windowed-sinc low-pass filter (against aliasing) followed by linear interpolation, with
+    the filter history and the interpolation position carried from one chunk to the next so
+    chunk boundaries are seamless. Good enough for speech; not a mastering-grade converter.
+    """
+
+    def __init__(self, from_rate, to_rate, taps=63):
+        self.step = from_rate / to_rate
+        cutoff = 0.9 * min(1.0, to_rate / from_rate) # As a fraction of the input Nyquist frequency
+        n = np.arange(taps) - (taps - 1) / 2
+        kernel = cutoff * np.sinc(cutoff * n) * np.hamming(taps)
+        self._kernel = (kernel / kernel.sum()).astype(np.float32)
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+        self._last = None # Last filtered sample, the start of the next interpolation span
+        self._position = 0.0 # Next output time, in input samples from self._last
+
+    def process(self, samples):
+        """Returns the resampled samples that the input so far allows."""
+        padded = np.concatenate([self._history, np.asarray(samples, dtype=np.float32)])
+        filtered = np.convolve(padded, self._kernel, mode='valid')
+        self._history = padded[len(padded) - len(self._history):]
+        if self._last is not None:
+            filtered = np.concatenate([[self._last], filtered])
+        if len(filtered) < 2:
+            return np.zeros(0, dtype=np.float32)
+        end = len(filtered) - 1
+        times = np.arange(self._position, end, self.step)
+        self._position = (times[-1] + self.step - end) if len(times) else self._position - end
+        self._last = filtered[-1]
+        return np.interp(times, np.arange(len(filtered)), filtered).astype(np.float32)
+
+    def flush(self):
+        """Returns the samples still held back by the filter's delay."""
+        return self.process(np.zeros(len(self._history) // 2, dtype=np.float32))
+
+
+class AudioWriter:
+    """Encodes audio to a file chunk by chunk, in the format given by the file extension.
+
+    Each write is encoded straight away, so a long synthesis never holds the whole output in
+    memory and compressed formats (FLAC, Ogg Vorbis, Opus) need no separate encoding pass.
+    With output_rate, the audio is resampled on the way.
+    """
+
+    def __init__(self, path, output_rate=None):
+        self.path = path
+        self.output_rate = output_rate
+        self._format = output_format(path)
+        self._file = None
+        self._resampler = None
+        self.frames = 0
+
+    def write(self, samples, sample_rate):
+        if self._file is None:
+            rate = self.output_rate or sample_rate
+            if self._format[1] == 'OPUS' and rate not in OPUS_SAMPLE_RATES:
+                raise ValueError(f"Opus can't encode {rate} Hz audio (supported: {', '.join(map(str, OPUS_SAMPLE_RATES))}).")
+            if rate != sample_rate:
+                self._resampler = StreamResampler(sample_rate, rate)
+            self._file = sf.SoundFile(self.path, 'w', samplerate=rate, channels=1,
+                                      format=self._format[0], subtype=self._format[1])
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        self._file.write(samples)
+        self.frames += len(samples)
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._resampler is not None:
+            tail = self._resampler.flush()
+            self._file.write(tail)
+            self.frames += len(tail)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_audio(path, samples, sample_rate, output_rate=None, block_seconds=10):
+    """Writes a complete utterance in the format given by the extension, encoding block by block."""
+    block = int(block_seconds * sample_rate)
+    with AudioWriter(path, output_rate) as writer:
+        for start in range(0, max(len(samples), 1), block):
+            writer.write(samples[start:start + block], sample_rate)
@@ -0,0 +1,57 @@
+import csv
+import json
+import os
+
+from engine import SynthesisJob
+from text_split import group_sentences, split_sentences
+
+DEFAULT_CHUNK_CHARS = 400 # Text-file mode: characters of whole sentences per output file
+
+
+def read_manifest(manifest_path, output_dir, voice, lang, speed, output_format='wav', sample_rate=None):
+    """Reads synthesis jobs from a JSONL or CSV manifest.
+
+    Each record has a 'text' and optionally 'voice', 'lang', 'speed', 'sample_rate' and 'output'
+    (a path, relative to output_dir unless absolute, whose extension picks the format); missing
+    values fall back to the given defaults, and missing outputs are numbered by record.
+    """
+    with open(manifest_path, encoding='utf-8', newline='') as f:
+        if manifest_path.lower().endswith('.csv'):
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    jobs = []
+    for number, record in enumerate(records, start=1):
+        text = (record.get('text') or '').strip()
+        if not text:
+            raise ValueError(f"Record {number} of {manifest_path} has no text.")
+        output = record.get('output') or record.get('output_path') or f"{number:05d}.{output_format}"
+        jobs.append(SynthesisJob(
+            text=text,
+            voice=record.get('voice') or voice,
+            lang=record.get('lang') or lang,
+            speed=float(record.get('speed') or speed),
+            output_path=os.path.join(output_dir, output),
+            sample_rate=int(record.get('sample_rate') or 0) or sample_rate,
+        ))
+    return jobs
+
+
+def read_text_file(text_path, output_dir, voice, lang, speed, chunk_chars=DEFAULT_CHUNK_CHARS,
+                   output_format='wav', sample_rate=None):
+    """Splits a long text file on sentence boundaries into numbered jobs, <name>_0001.wav onwards."""
+    with open(text_path, encoding='utf-8') as f:
+        chunks = group_sentences(split_sentences(f.read()), chunk_chars)
+    stem = os.path.splitext(os.path.basename(text_path))[0]
+    return [SynthesisJob(chunk, voice, lang, speed, os.path.join(output_dir, f"{stem}_{number:04d}.{output_format}"),
+                         sample_rate)
+            for number, chunk in enumerate(chunks, start=1)]
+
+
+def pending_jobs(jobs, overwrite=False):
+    """Returns (jobs to run, number skipped). Finished outputs are skipped so an interrupted batch resumes."""
+    if overwrite:
+        return list(jobs), 0
+    todo = [job for job in jobs if not os.path.exists(job.output_path)]
+    return todo, len(jobs) - len(todo)
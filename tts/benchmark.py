@@ -0,0 +1,75 @@
+"""Compare serial and parallel multi-voice synthesis on CPU.
+
+Synthesizes the same text with several voices, first one voice at a time on a single model
+(as cli.py --test used to), then with the thread and process modes of engine.ParallelSynthesizer.
+Each configuration is warmed up first, so model loading and worker start-up aren't timed.
+
+Example:
+    python benchmark.py --voice-count 8 --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+# Benchmark the CPU provider unless told otherwise; worker processes inherit this
+os.environ.setdefault('ONNX_PROVIDER', 'CPUExecutionProvider')
+
+from cli import ALL_ENGLISH_VOICES
+from engine import ParallelSynthesizer, SynthesisJob, available_cpus
+
+DEFAULT_BENCHMARK_TEXT = (
+    "The quick brown fox jumps over the lazy dog. "
+    "Speech synthesis turns written language into audio, one sentence at a time, "
+    "and the time it takes depends on the length of the text and the speed of the machine."
+)
+
+
+def run_configuration(args, voices, output_dir, workers, mode, threads_per_worker):
+    """Returns the SynthesisReport of one configuration, after a warm-up round."""
+    with ParallelSynthesizer(args.model, args.voices, workers=workers, mode=mode,
+                             threads_per_worker=threads_per_worker) as synthesizer:
+        warmup = [SynthesisJob("Warm up.", voices[0], "en-us", 1.0, os.path.join(output_dir, f"warmup_{i}.wav"))
+                  for i in range(synthesizer.workers)]
+        synthesizer.run(warmup)
+        jobs = [SynthesisJob(args.text, voice, "en-us", 1.0, os.path.join(output_dir, f"{mode}_{voice}.wav"))
+                for voice in voices]
+        return synthesizer.run(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial and parallel Kokoro synthesis on CPU.")
+    parser.add_argument("--model", default="kokoro-v1.0.onnx", help="Path to the Kokoro model file (default: kokoro-v1.0.onnx).")
+    parser.add_argument("--voices", default="voices-v1.0.bin", help="Path to the voices file (default: voices-v1.0.bin).")
+    parser.add_argument("--text", default=DEFAULT_BENCHMARK_TEXT, help="Text to synthesize with every voice.")
+    parser.add_argument("--voice-count", type=int, default=8, help=f"Number of English voices to synthesize (default: 8, max: {len(ALL_ENGLISH_VOICES)}).")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel workers (default: up to 4, limited by CPU cores).")
+    args = parser.parse_args()
+
+    voices = ALL_ENGLISH_VOICES[:args.voice_count]
+    cpus = available_cpus()
+    print(f"{len(voices)} voices, {cpus} CPU core(s), provider {os.environ['ONNX_PROVIDER']}")
+
+    configurations = [
+        ("serial", 1, "thread", cpus),
+        ("threads", args.workers, "thread", 0),
+        ("processes", args.workers, "process", 0),
+    ]
+    serial_seconds = None
+    with tempfile.TemporaryDirectory() as output_dir:
+        for name, workers, mode, threads_per_worker in configurations:
+            try:
+                report = run_configuration(args, voices, output_dir, workers, mode, threads_per_worker)
+            except FileNotFoundError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            if report.failed:
+                print(f"{name}: {report.failed} job(s) failed, e.g. {next(r.error for r in report.results if r.error)}",
+                      file=sys.stderr)
+            serial_seconds = serial_seconds or report.wall_seconds
+            print(f"{name:>10}: {report.wall_seconds:7.2f}s wall, real-time factor {report.real_time_factor:.3f}, "
+                  f"speedup {serial_seconds / report.wall_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Benchmark Kokoro on a fixed corpus and write the results as JSON.
+
+Measures cold start (model load and first synthesis), then synthesizes short, medium and long
+texts with several voices. Every run is timed twice: as one complete synthesis (latency) and as
+a sentence stream (time to first audio). Latency and time to first audio are reported as
+p50/p95/p99 per text length, together with the real-time factor.
+
+The JSON records the onnxruntime and kokoro-onnx versions and the session settings, so runs
+can be compared across versions and settings:
+    python benchmark_suite.py --output before.json
+    python benchmark_suite.py --threads-per-worker 4 --output after.json --compare before.json
+"""
+import argparse
+import importlib.metadata
+import json
+import math
+import os
+import platform
+import sys
+import time
+
+# Benchmark the CPU provider unless told otherwise
+os.environ.setdefault('ONNX_PROVIDER', 'CPUExecutionProvider')
+
+import onnxruntime as rt
+
+from cli import add_session_arguments, session_settings
+from engine import available_cpus, load_kokoro, synthesize
+from streaming import stream_to_callback
+
+CORPUS = {
+    'short': [
+        "Hello!",
+        "Your download is complete.",
+        "Turn left in two hundred meters.",
+    ],
+    'medium': [
+        "The meeting has been moved to Thursday afternoon. Please update your calendar "
+        "and let the team know if the new time doesn't work for you.",
+        "Speech synthesis turns written language into audio. The time it takes depends on "
+        "the length of the text and on the speed of the machine it runs on.",
+    ],
+    'long': [
+        "The lighthouse stood at the end of a narrow spit of rock, its white paint long since "
+        "weathered to the colour of old bone. For more than a century it had warned ships away "
+        "from the reef that lay hidden beneath the grey water. The keepers came and went, each "
+        "leaving a few lines in the logbook: the weather, the ships that passed, the oil burned "
+        "through the night. When the light was finally automated, the last keeper locked the "
+        "door behind him and walked back along the causeway without looking back. The logbook "
+        "stayed on the table, open at the final page, where he had written only the date and "
+        "a single word: clear. Years later, a storm tore the door from its hinges, and the pages "
+        "scattered across the rocks like gulls.",
+    ],
+}
+DEFAULT_VOICES = "af_sarah,af_heart,am_adam,bf_emma"
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def distribution(values):
+    """Mean and percentiles of a list of timings, in seconds."""
+    summary = {'mean': sum(values) / len(values)}
+    summary.update({f"p{p}": percentile(values, p) for p in PERCENTILES})
+    return summary
+
+
+def environment(args, settings):
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'cpus': available_cpus(),
+        'onnxruntime': rt.__version__,
+        'kokoro_onnx': importlib.metadata.version('kokoro-onnx'),
+        'provider': os.environ['ONNX_PROVIDER'],
+        'model': os.path.basename(args.model),
+        'model_bytes': os.path.getsize(args.model),
+        'intra_op_threads': args.threads_per_worker,
+        'inter_op_threads': args.inter_op_threads,
+        'session': settings._asdict(),
+    }
+
+
+def run_category(kokoro, texts, voices, repeats):
+    """Times every text with every voice, repeats times, and returns the category's results."""
+    latencies = []
+    first_audio = []
+    audio_seconds = 0.0
+    for _ in range(repeats):
+        for text in texts:
+            for voice in voices:
+                start = time.perf_counter()
+                samples, sample_rate = synthesize(kokoro, text, voice, "en-us", 1.0)
+                latencies.append(time.perf_counter() - start)
+                audio_seconds += len(samples) / sample_rate
+                stats = stream_to_callback(kokoro, text, voice, "en-us", 1.0, lambda samples, sample_rate: None)
+                first_audio.append(stats.first_audio_seconds)
+    synthesis_seconds = sum(latencies)
+    return {
+        'runs': len(latencies),
+        'characters': sum(len(text) for text in texts),
+        'audio_seconds': audio_seconds,
+        'synthesis_seconds': synthesis_seconds,
+        'real_time_factor': synthesis_seconds / audio_seconds,
+        'latency': distribution(latencies),
+        'time_to_first_audio': distribution(first_audio),
+    }
+
+
+def print_comparison(results, baseline_path):
+    """Prints each headline number next to the same number from an earlier run."""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (onnxruntime {baseline['environment']['onnxruntime']}):")
+    rows = [('cold start', ('cold_start', 'total_seconds'))]
+    for category in results['categories']:
+        rows += [(f"{category} RTF", ('categories', category, 'real_time_factor')),
+                 (f"{category} latency p95", ('categories', category, 'latency', 'p95')),
+                 (f"{category} first audio p95", ('categories', category, 'time_to_first_audio', 'p95'))]
+    for label, keys in rows:
+        old, new = baseline, results
+        try:
+            for key in keys:
+                old, new = old[key], new[key]
+        except KeyError:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"  {label:<24} {old:8.3f} -> {new:8.3f}  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Kokoro TTS on a fixed corpus and write the results as JSON.")
+    parser.add_argument("--model", default="kokoro-v1.0.onnx", help="Path to the Kokoro model file (default: kokoro-v1.0.onnx).")
+    parser.add_argument("--voices", default="voices-v1.0.bin", help="Path to the voices file (default: voices-v1.0.bin).")
+    parser.add_argument("--voice-ids", default=DEFAULT_VOICES, help=f"Comma-separated voices to synthesize with (default: {DEFAULT_VOICES}).")
+    parser.add_argument("--repeats", type=int, default=3, help="Times every text and voice is synthesized (default: 3).")
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="ONNX Runtime intra-op threads (default: onnxruntime's choice).")
+    add_session_arguments(parser)
+    parser.add_argument("--output", default="tts-benchmark.json", help="JSON file for the results (default: tts-benchmark.json).")
+    parser.add_argument("--compare", help="Earlier results file to compare this run with.")
+    args = parser.parse_args()
+    settings = session_settings(args)
+    voices = [voice.strip() for voice in args.voice_ids.split(',') if voice.strip()]
+
+    start = time.perf_counter()
+    try:
+        kokoro = load_kokoro(args.model, args.voices, args.threads_per_worker, args.inter_op_threads, settings)
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    load_seconds = time.perf_counter() - start
+    missing = [voice for voice in voices if voice not in kokoro.get_voices()]
+    if missing:
+        parser.error(f"Unknown voice(s): {', '.join(missing)}")
+    synthesize(kokoro, CORPUS['short'][0], voices[0], "en-us", 1.0)
+    first_seconds = time.perf_counter() - start - load_seconds
+
+    results = {
+        'environment': environment(args, settings),
+        'voices': voices,
+        'repeats': args.repeats,
+        'cold_start': {'load_seconds': load_seconds, 'first_synthesis_seconds': first_seconds,
+                       'total_seconds': load_seconds + first_seconds},
+        'categories': {},
+    }
+    print(f"Cold start: model loaded in {load_seconds:.2f}s, first synthesis {first_seconds:.2f}s")
+    print(f"{'texts':<8} {'runs':>5} {'audio':>8} {'synth':>8} {'RTF':>7} {'lat p50':>8} {'p95':>7} {'p99':>7} "
+          f"{'TTFA p50':>9} {'p95':>7} {'p99':>7}")
+    for category, texts in CORPUS.items():
+        result = results['categories'][category] = run_category(kokoro, texts, voices, args.repeats)
+        latency, first_audio = result['latency'], result['time_to_first_audio']
+        print(f"{category:<8} {result['runs']:>5} {result['audio_seconds']:7.1f}s {result['synthesis_seconds']:7.2f}s "
+              f"{result['real_time_factor']:7.3f} {latency['p50']:7.3f}s {latency['p95']:6.3f}s {latency['p99']:6.3f}s "
+              f"{first_audio['p50']:8.3f}s {first_audio['p95']:6.3f}s {first_audio['p99']:6.3f}s")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to '{args.output}'")
+    if args.compare:
+        try:
+            print_comparison(results, args.compare)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading '{args.compare}': {e}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
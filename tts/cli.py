@@ -1,8 +1,15 @@
 import argparse
+import contextlib
 import sys
 import os
-import soundfile as sf
-from kokoro_onnx import Kokoro
+from audio_cache import DEFAULT_CACHE_MAX_MB, AudioCache
+from audio_output import OUTPUT_FORMATS, write_audio
+from batch import DEFAULT_CHUNK_CHARS, pending_jobs, read_manifest, read_text_file
+from engine import (EXECUTION_MODES, GRAPH_OPTIMIZATION_LEVELS, ParallelSynthesizer, SessionSettings, SynthesisJob,
+                    int8_model_path, load_kokoro)
+from markdown_pipeline import (assemble_audiobook, chapter_jobs, remove_parts, split_chapters, strip_markdown,
+                               write_cue_sheet, write_ffmetadata)
+from streaming import stream_to_file, stream_to_pipe
 
 # Available Voices (from VOICES.md):
 # American English (lang_code='a'):
@@ -44,8 +51,8 @@ BRITISH_ENGLISH_VOICES = [
 ALL_ENGLISH_VOICES = AMERICAN_ENGLISH_VOICES + BRITISH_ENGLISH_VOICES
 DEFAULT_TEST_SENTENCE = "The quick brown fox jumps over the lazy dog."
 
-def synthesize_audio(kokoro, text, voice, lang, speed, output_path):
-    """Generates and saves audio for a single voice."""
+def synthesize_audio(kokoro, text, voice, lang, speed, output_path, cache=None, output_rate=None):
+    """Generates and saves audio for a single voice, reusing cached sentences if a cache is given."""
     try:
         print(f"\nSynthesizing text: '{text}'")
         print(f"Using voice: {voice}")
@@ -54,16 +61,24 @@ def synthesize_audio(kokoro, text, voice, lang, speed, output_path):
         print(f"Output path: {output_path}")
 
         # Generate audio samples
-        samples, sample_rate = kokoro.create(
-            text,
-            voice=voice,
-            speed=speed,
-            lang=lang
-        )
+        if cache is not None:
+            samples, sample_rate = cache.synthesize(kokoro, text, voice, lang, speed)
+            print(f"Audio cache: {cache.hits} sentence(s) reused, {cache.misses} synthesized")
+        else:
+            samples, sample_rate = kokoro.create(
+                text,
+                voice=voice,
+                speed=speed,
+                lang=lang
+            )
         print(f"Audio generated with sample rate: {sample_rate}")
 
-        # Save the audio to a WAV file
-        sf.write(output_path, samples, sample_rate)
+        # Save the audio in the format given by the file extension
+        try:
+            write_audio(output_path, samples, sample_rate, output_rate)
+        except ValueError as e: # Unsupported extension or sample rate, not a synthesis problem
+            print(f"Error saving audio to '{output_path}': {e}", file=sys.stderr)
+            return False
         print(f"Audio saved to '{output_path}'")
         return True
 
@@ -76,45 +91,207 @@ def synthesize_audio(kokoro, text, voice, lang, speed, output_path):
         return False
 
 
+def load_or_exit(load, args):
+    """Runs a model loading function, exiting with a helpful message if it fails."""
+    try:
+        loaded = load()
+        print("Kokoro model loaded successfully.")
+        return loaded
+
+    except FileNotFoundError:
+        print(f"Error: Model file '{args.model}' or voices file '{args.voices}' not found.", file=sys.stderr)
+        print("Please ensure the paths are correct or download them from https://github.com/thewh1teagle/kokoro-onnx/releases", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error initializing Kokoro: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def add_session_arguments(parser):
+    """Adds the model and ONNX Runtime session options shared by cli.py, server.py and the benchmarks."""
+    parser.add_argument("--int8", action="store_true", help="Use the int8-quantized model next to --model (e.g. kokoro-v1.0.int8.onnx), which is smaller and usually faster on CPU.")
+    parser.add_argument("--inter-op-threads", type=int, default=1, help="ONNX Runtime inter-op threads per session; only used with --execution-mode parallel (default: 1).")
+    parser.add_argument("--execution-mode", choices=list(EXECUTION_MODES), default="sequential", help="Run graph operators one at a time or independent branches in parallel (default: sequential).")
+    parser.add_argument("--graph-optimization", choices=list(GRAPH_OPTIMIZATION_LEVELS), default="all", help="ONNX Runtime graph optimization level (default: all).")
+    parser.add_argument("--optimized-model-dir", help="Cache the optimized graph here and load it on later runs, skipping optimization at start-up.")
+    parser.add_argument("--no-spinning", action="store_true", help="Let idle ONNX Runtime threads sleep instead of spinning; helps when many processes share a host.")
+
+
+def session_settings(args):
+    """Applies --int8 to args.model and returns the SessionSettings chosen on the command line."""
+    if args.int8:
+        args.model = int8_model_path(args.model)
+    return SessionSettings(args.execution_mode, args.graph_optimization, args.optimized_model_dir, not args.no_spinning)
+
+
+def create_cache(args):
+    """Opens the audio cache given by --cache-dir, or returns None without one."""
+    if not args.cache_dir:
+        return None
+    try:
+        return AudioCache(args.cache_dir, args.model, args.voices, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+    except FileNotFoundError:
+        print(f"Error: Model file '{args.model}' or voices file '{args.voices}' not found.", file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error opening audio cache '{args.cache_dir}': {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def create_synthesizer(args, settings, cache=None):
+    """Creates the parallel synthesis engine configured by the command-line arguments."""
+    return load_or_exit(lambda: ParallelSynthesizer(args.model, args.voices, workers=args.workers,
+                                                    mode=args.parallel_mode,
+                                                    threads_per_worker=args.threads_per_worker,
+                                                    cache=cache, inter_op_threads=args.inter_op_threads,
+                                                    settings=settings), args)
+
+
+def print_result(result):
+    """Reports one finished job from the parallel engine."""
+    if result.error:
+        print(f"Error during synthesis for voice {result.job.voice}: {result.error}", file=sys.stderr)
+    else:
+        print(f"Audio saved to '{result.job.output_path}' ({result.audio_seconds:.1f}s of audio "
+              f"in {result.synthesis_seconds:.2f}s)")
+
+
+def stream_main(parser, args, settings):
+    """Streaming mode: one long text synthesized incrementally to a file or stdout."""
+    if args.test or args.manifest:
+        parser.error("--stream can't be combined with --test or --manifest.")
+    if args.text_file or args.markdown:
+        try:
+            with open(args.text_file or args.markdown, encoding='utf-8') as f:
+                args.text = f.read()
+        except OSError as e:
+            print(f"Error reading text file: {e}", file=sys.stderr)
+            sys.exit(1)
+        if args.markdown:
+            args.text = strip_markdown(args.text)
+    if not args.text:
+        parser.error("--stream needs --text, --text-file or --markdown.")
+
+    to_stdout = args.output_filename == '-'
+    audio_out = sys.stdout.buffer
+    # Audio goes to stdout, so progress messages must not
+    with contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext():
+        print(f"Loading Kokoro model: {args.model}")
+        print(f"Loading voices: {args.voices}")
+        kokoro = load_or_exit(lambda: load_kokoro(args.model, args.voices, args.threads_per_worker,
+                                                  args.inter_op_threads, settings), args)
+        try:
+            if to_stdout:
+                stats = stream_to_pipe(kokoro, args.text, args.voice, args.lang, args.speed, audio_out, raw=args.raw)
+            else:
+                os.makedirs(args.output_dir, exist_ok=True)
+                output_path = os.path.join(args.output_dir, args.output_filename)
+                stats = stream_to_file(kokoro, args.text, args.voice, args.lang, args.speed, output_path,
+                                       args.sample_rate)
+                print(f"Audio saved to '{output_path}'")
+        except BrokenPipeError:
+            sys.exit(0) # The reader (e.g. a player) went away
+        except Exception as e:
+            print(f"Error during streaming synthesis: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"First audio after {stats.first_audio_seconds:.2f}s; {stats.audio_seconds:.1f}s of audio "
+              f"in {stats.total_seconds:.1f}s")
+
+
+def markdown_main(args, settings, cache):
+    """Markdown mode: one audio file per chapter, plus the whole document with chapter markers."""
+    try:
+        with open(args.markdown, encoding='utf-8') as f:
+            chapters = split_chapters(f.read(), args.chapter_level)
+    except OSError as e:
+        print(f"Error reading Markdown file: {e}", file=sys.stderr)
+        sys.exit(1)
+    if not chapters:
+        print(f"Error: '{args.markdown}' contains no text to synthesize.", file=sys.stderr)
+        sys.exit(1)
+
+    stem = os.path.splitext(os.path.basename(args.markdown))[0]
+    chapter_dir = os.path.join(args.output_dir, stem)
+    book_path = os.path.join(args.output_dir, f"{stem}.{args.format}")
+    jobs = chapter_jobs(chapters, chapter_dir, args.voice, args.lang, args.speed, args.chunk_chars)
+    todo, skipped = pending_jobs([job for parts in jobs for job in parts], overwrite=args.overwrite)
+    print(f"\n--- Markdown Mode: {len(chapters)} chapter(s), {len(todo)} part(s) to synthesize, {skipped} already done ---")
+    if todo:
+        # Parts of all chapters share the worker pool; finished parts survive a failed run
+        synthesizer = create_synthesizer(args, settings, cache)
+        with synthesizer:
+            report = synthesizer.run(todo, on_result=print_result)
+        print(f"\n--- Synthesis Complete: {report.summary()} ---")
+        if report.failed:
+            sys.exit(1)
+
+    try:
+        marks = assemble_audiobook(chapters, jobs, chapter_dir, book_path, args.format, args.sample_rate)
+        root = os.path.splitext(book_path)[0]
+        write_cue_sheet(f"{root}.cue", book_path, marks, stem)
+        write_ffmetadata(f"{root}.chapters.txt", marks, stem)
+    except (OSError, ValueError) as e:
+        print(f"Error assembling the audio: {e}", file=sys.stderr)
+        sys.exit(1)
+    remove_parts(chapter_dir)
+    for mark in marks:
+        minutes, seconds = divmod(mark.start_seconds, 60)
+        print(f"{int(minutes):3d}:{seconds:04.1f}  {mark.title}  ->  {mark.path}")
+    print(f"Audio saved to '{book_path}', chapters in '{root}.cue' and '{root}.chapters.txt'")
+
+
 def main():
     """Parses command-line arguments and generates audio using Kokoro ONNX."""
 
-    parser = argparse.ArgumentParser(description="Generate audio from text using Kokoro ONNX. Use --test to generate samples for all English voices.")
-    parser.add_argument("--text", help=f"Text to synthesize. Required unless --test is used (default for test: '{DEFAULT_TEST_SENTENCE}').")
+    parser = argparse.ArgumentParser(description="Generate audio from text using Kokoro ONNX. Use --test to generate samples for all English voices, --manifest or --text-file for batches, --markdown for documents.")
+    parser.add_argument("--text", help=f"Text to synthesize. Required unless --test, --manifest, --text-file or --markdown is used (default for test: '{DEFAULT_TEST_SENTENCE}').")
     parser.add_argument("--voice", default="af_sarah", help="Voice ID to use (default: af_sarah). Ignored if --test is used.")
     parser.add_argument("--lang", default="en-us", help="Language code (default: en-us). Ignored if --test is used.")
     parser.add_argument("--speed", type=float, default=1.0, help="Synthesis speed (default: 1.0).")
     parser.add_argument("--test", action="store_true", help="Generate audio for all English voices using the default test sentence or provided text.")
-    parser.add_argument("--output-dir", required=True, help="Directory to save the output audio file(s).")
-    parser.add_argument("--output-filename", default="output.wav", help="Name for the output audio file (default: output.wav). Ignored if --test is used; filenames will be based on voice ID.")
+    parser.add_argument("--output-dir", help="Directory to save the output audio file(s). Required unless --stream writes to stdout.")
+    parser.add_argument("--output-filename", help="Name for the output audio file (default: output.wav, or output.<format> with --format); the extension picks the format. '-' writes to stdout with --stream. Ignored if --test is used; filenames will be based on voice ID.")
+    parser.add_argument("--format", choices=list(OUTPUT_FORMATS), help="Audio format of generated file names (test and batch modes) and of the default output file (default: wav).")
+    parser.add_argument("--sample-rate", type=int, help="Resample the output to this rate in Hz (default: the model's 24000).")
     parser.add_argument("--model", default="kokoro-v1.0.onnx", help="Path to the Kokoro model file (default: kokoro-v1.0.onnx).")
     parser.add_argument("--voices", default="voices-v1.0.bin", help="Path to the voices file (default: voices-v1.0.bin).")
+    parser.add_argument("--manifest", help="Batch mode: JSONL or CSV file with one job per record (text, and optionally voice, lang, speed, output).")
+    parser.add_argument("--text-file", help="Batch mode: long text file, split on sentences into numbered output files.")
+    parser.add_argument("--markdown", help="Markdown mode: synthesize a Markdown document into one file per chapter (split on headings) plus a combined file with chapter markers.")
+    parser.add_argument("--chapter-level", type=int, choices=range(1, 7), help="Heading level that starts a chapter with --markdown (default: the highest level used at least twice).")
+    parser.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS, help=f"Characters of whole sentences per file with --text-file, or per synthesis job with --markdown (default: {DEFAULT_CHUNK_CHARS}).")
+    parser.add_argument("--stream", action="store_true", help="Synthesize --text (or all of --text-file) sentence by sentence, writing audio as it is produced.")
+    parser.add_argument("--raw", action="store_true", help="With --stream to stdout: write raw 16-bit PCM instead of a WAV stream.")
+    parser.add_argument("--overwrite", action="store_true", help="Batch mode: synthesize again even if the output file already exists.")
+    parser.add_argument("--workers", type=int, default=0, help="Parallel synthesis workers for --test and batch mode (default: up to 4, limited by CPU cores).")
+    parser.add_argument("--parallel-mode", choices=["thread", "process"], default="thread", help="Share one model between worker threads, or load one per worker process (default: thread).")
+    add_session_arguments(parser)
+    parser.add_argument("--cache-dir", help="Directory of cached sentence audio; repeated sentences are reused instead of synthesized again (not used with --stream).")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_MB, help=f"Size limit of the audio cache; least recently used sentences are evicted (default: {DEFAULT_CACHE_MAX_MB}).")
+    parser.add_argument("--threads-per-worker", type=int, default=0, help="ONNX Runtime intra-op threads per worker (default: CPU cores divided by workers, or all cores for a single synthesis).")
 
     args = parser.parse_args()
+    if args.output_filename is None:
+        args.output_filename = f"output.{args.format or 'wav'}"
+    args.format = args.format or 'wav'
+    settings = session_settings(args)
+    if args.output_dir is None and not (args.stream and args.output_filename == '-'):
+        parser.error("--output-dir is required unless --stream writes to stdout (--output-filename -).")
+
+    if args.stream:
+        stream_main(parser, args, settings)
+        return
 
     # Validate arguments
-    if not args.test and not args.text:
-        parser.error("--text is required unless --test is specified.")
+    batch_mode = bool(args.manifest or args.text_file or args.markdown)
+    if sum(1 for option in (args.manifest, args.text_file, args.markdown) if option) > 1:
+        parser.error("--manifest, --text-file and --markdown can't be combined.")
+    if not args.test and not batch_mode and not args.text:
+        parser.error("--text is required unless --test, --manifest, --text-file or --markdown is specified.")
     if args.test and not args.text:
         args.text = DEFAULT_TEST_SENTENCE
         print(f"Using default test sentence: '{args.text}'")
 
-    print(f"Loading Kokoro model: {args.model}")
-    print(f"Loading voices: {args.voices}")
-
-    try:
-        # Initialize Kokoro
-        kokoro = Kokoro(args.model, args.voices)
-        print("Kokoro model loaded successfully.")
-
-    except FileNotFoundError:
-        print(f"Error: Model file '{args.model}' or voices file '{args.voices}' not found.", file=sys.stderr)
-        print("Please ensure the paths are correct or download them from https://github.com/thewh1teagle/kokoro-onnx/releases", file=sys.stderr)
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error initializing Kokoro: {e}", file=sys.stderr)
-        sys.exit(1)
-
     # Ensure output directory exists
     try:
         os.makedirs(args.output_dir, exist_ok=True)
@@ -122,10 +299,13 @@ def main():
         print(f"Error creating output directory '{args.output_dir}': {e}", file=sys.stderr)
         sys.exit(1)
 
+    print(f"Loading Kokoro model: {args.model}")
+    print(f"Loading voices: {args.voices}")
+    cache = create_cache(args)
+
     if args.test:
         print("\n--- Running in Test Mode: Generating samples for all English voices ---")
-        success_count = 0
-        fail_count = 0
+        jobs = []
         for voice_id in ALL_ENGLISH_VOICES:
             # Determine language code based on voice prefix (though 'en-us' might work for both)
             lang_code = "en-us" # Defaulting to en-us as per comments and common usage
@@ -134,19 +314,48 @@ def main():
             # else:
             #     lang_code = "en-us"
 
-            output_filename = f"{voice_id}.wav"
-            output_path = os.path.join(args.output_dir, output_filename)
+            output_filename = f"{voice_id}.{args.format}"
+            jobs.append(SynthesisJob(args.text, voice_id, lang_code, args.speed, os.path.join(args.output_dir, output_filename),
+                                     args.sample_rate))
+
+        synthesizer = create_synthesizer(args, settings, cache)
+        print(f"Synthesizing {len(jobs)} voices with {synthesizer.workers} {synthesizer.mode} worker(s), "
+              f"{synthesizer.threads_per_worker} thread(s) each")
+        with synthesizer:
+            report = synthesizer.run(jobs, on_result=print_result)
+        print(f"\n--- Test Mode Complete: {report.summary()} ---")
+
+    elif args.markdown:
+        markdown_main(args, settings, cache)
 
-            if synthesize_audio(kokoro, args.text, voice_id, lang_code, args.speed, output_path):
-                success_count += 1
+    elif batch_mode:
+        try:
+            if args.manifest:
+                jobs = read_manifest(args.manifest, args.output_dir, args.voice, args.lang, args.speed,
+                                     args.format, args.sample_rate)
             else:
-                fail_count += 1
-        print(f"\n--- Test Mode Complete: {success_count} succeeded, {fail_count} failed ---")
+                jobs = read_text_file(args.text_file, args.output_dir, args.voice, args.lang, args.speed, args.chunk_chars,
+                                      args.format, args.sample_rate)
+        except (OSError, ValueError) as e:
+            print(f"Error reading batch input: {e}", file=sys.stderr)
+            sys.exit(1)
+        jobs, skipped = pending_jobs(jobs, overwrite=args.overwrite)
+        print(f"\n--- Batch Mode: {len(jobs)} job(s) to synthesize, {skipped} already done ---")
+        if jobs:
+            # The model is loaded once and stays warm for the whole batch
+            synthesizer = create_synthesizer(args, settings, cache)
+            with synthesizer:
+                report = synthesizer.run(jobs, on_result=print_result)
+            print(f"\n--- Batch Complete: {report.summary()} ---")
+            if report.failed:
+                sys.exit(1)
 
     else:
         # Original single synthesis logic
+        kokoro = load_or_exit(lambda: load_kokoro(args.model, args.voices, args.threads_per_worker,
+                                                  args.inter_op_threads, settings), args)
         output_path = os.path.join(args.output_dir, args.output_filename)
-        synthesize_audio(kokoro, args.text, args.voice, args.lang, args.speed, output_path)
+        synthesize_audio(kokoro, args.text, args.voice, args.lang, args.speed, output_path, cache, args.sample_rate)
 
 
 if __name__ == "__main__":
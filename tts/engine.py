@@ -0,0 +1,267 @@
+import hashlib
+import multiprocessing
+import os
+import platform
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import onnxruntime as rt
+from kokoro_onnx import Kokoro
+
+from audio_output import write_audio
+from voice_store import VoiceStore
+
+# One synthesis request: the text, how to speak it, and where the audio goes. The output format
+# follows the file extension; sample_rate resamples the output (None keeps the model's rate).
+SynthesisJob = namedtuple('SynthesisJob', ['text', 'voice', 'lang', 'speed', 'output_path', 'sample_rate'],
+                          defaults=[None])
+# Outcome of one job; error is None on success
+SynthesisResult = namedtuple('SynthesisResult', ['job', 'audio_seconds', 'synthesis_seconds', 'error'])
+# How the onnxruntime session runs the graph; thread counts are passed separately since they
+# depend on how many workers share the machine
+SessionSettings = namedtuple('SessionSettings',
+                             ['execution_mode', 'graph_optimization', 'optimized_model_dir', 'allow_spinning'],
+                             defaults=['sequential', 'all', None, True])
+
+EXECUTION_MODES = {
+    'sequential': rt.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': rt.ExecutionMode.ORT_PARALLEL, # Runs independent graph branches on the inter-op threads
+}
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': rt.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': rt.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': rt.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': rt.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+# espeak-ng keeps global state and older kokoro-onnx releases don't guard it, so phonemization
+# is serialized here. It is cheap next to inference, which runs concurrently.
+_phonemize_lock = threading.Lock()
+_worker_kokoro = None # Model loaded once per worker process, see _init_worker()
+_worker_cache = None
+
+
+def available_cpus():
+    """Returns the number of cores this process may run on (honouring container CPU sets on Linux)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def session_providers():
+    """Execution providers for the session: ONNX_PROVIDER if set, otherwise every available one."""
+    provider = os.getenv('ONNX_PROVIDER')
+    return [provider] if provider else rt.get_available_providers()
+
+
+def int8_model_path(model_path):
+    """Path of the int8-quantized variant of a model, e.g. kokoro-v1.0.int8.onnx for kokoro-v1.0.onnx."""
+    root, ext = os.path.splitext(model_path)
+    return model_path if root.endswith('.int8') else f"{root}.int8{ext}"
+
+
+def optimized_model_path(model_path, settings, providers):
+    """Where the graph optimized for these settings is cached.
+
+    Optimized graphs can contain provider- and CPU-specific kernels, so the name depends on the
+    provider, the machine and the onnxruntime version as well as on the model file itself.
+    """
+    stat = os.stat(model_path)
+    fingerprint = '|'.join([os.path.abspath(model_path), str(stat.st_size), str(stat.st_mtime_ns),
+                            settings.graph_optimization, ','.join(providers), platform.machine(), rt.__version__])
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+    return os.path.join(settings.optimized_model_dir, f"{stem}.{settings.graph_optimization}.{digest}.onnx")
+
+
+def session_options(settings, intra_op_threads=0, inter_op_threads=0):
+    """Builds SessionOptions from SessionSettings and thread counts (0 keeps the onnxruntime default)."""
+    if settings.execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode '{settings.execution_mode}'.")
+    if settings.graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph optimization level '{settings.graph_optimization}'.")
+    options = rt.SessionOptions()
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = EXECUTION_MODES[settings.execution_mode]
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[settings.graph_optimization]
+    if not settings.allow_spinning:
+        # Idle threads sleep instead of spinning, which keeps many worker processes from
+        # burning each other's cores at some cost in latency
+        options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+        options.add_session_config_entry('session.inter_op.allow_spinning', '0')
+    return options
+
+
+def create_session(model_path, settings=None, intra_op_threads=0, inter_op_threads=0):
+    """Creates the onnxruntime session, reusing a cached optimized graph if settings name a cache directory."""
+    settings = settings or SessionSettings()
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at {model_path}")
+    providers = session_providers()
+    options = session_options(settings, intra_op_threads, inter_op_threads)
+    if not settings.optimized_model_dir or settings.graph_optimization == 'disable':
+        return rt.InferenceSession(model_path, sess_options=options, providers=providers)
+
+    cached_path = optimized_model_path(model_path, settings, providers)
+    if os.path.exists(cached_path):
+        # Already optimized offline, so loading skips the optimization passes
+        options.graph_optimization_level = rt.GraphOptimizationLevel.ORT_DISABLE_ALL
+        return rt.InferenceSession(cached_path, sess_options=options, providers=providers)
+
+    os.makedirs(settings.optimized_model_dir, exist_ok=True)
+    partial_path = f"{cached_path}.{os.getpid()}.part"
+    options.optimized_model_filepath = partial_path
+    session = rt.InferenceSession(model_path, sess_options=options, providers=providers)
+    if os.path.exists(partial_path):
+        os.replace(partial_path, cached_path) # Another process loading at the same time sees whole files only
+    return session
+
+
+def load_kokoro(model_path, voices_path, intra_op_threads=0, inter_op_threads=0, settings=None):
+    """Loads the model into an onnxruntime session with explicit thread counts (0 keeps the default).
+
+    settings (SessionSettings) choose the execution mode, graph optimization level and where
+    optimized graphs are cached. The voices file is memory-mapped (see voice_store.py), so
+    voices are only read when used.
+    """
+    session = create_session(model_path, settings, intra_op_threads, inter_op_threads)
+    kokoro = Kokoro.from_session(session, voices_path)
+    # Voices are memory-mapped and paged in on use instead of read from the archive on every call
+    kokoro.voices = VoiceStore(voices_path)
+    return kokoro
+
+
+def synthesize(kokoro, text, voice, lang, speed):
+    """Returns (samples, sample_rate) for text. Safe to call from several threads on one Kokoro."""
+    with _phonemize_lock:
+        phonemes = kokoro.tokenizer.phonemize(text, lang)
+    return kokoro.create(phonemes, voice=voice, speed=speed, lang=lang, is_phonemes=True)
+
+
+def run_job(kokoro, job, cache=None):
+    """Synthesizes one job to its output file and returns a SynthesisResult instead of raising.
+
+    With an AudioCache, sentences synthesized before are reused instead of running the model.
+    """
+    start = time.perf_counter()
+    root, ext = os.path.splitext(job.output_path)
+    partial_path = f"{root}.part{ext}" # Keeps the extension, which picks the format
+    try:
+        if cache is not None:
+            samples, sample_rate = cache.synthesize(kokoro, job.text, job.voice, job.lang, job.speed)
+        else:
+            samples, sample_rate = synthesize(kokoro, job.text, job.voice, job.lang, job.speed)
+        os.makedirs(os.path.dirname(job.output_path) or '.', exist_ok=True)
+        # Written under a temporary name so an interrupted run never leaves a truncated file behind
+        write_audio(partial_path, samples, sample_rate, job.sample_rate)
+        os.replace(partial_path, job.output_path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        return SynthesisResult(job, 0.0, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+    return SynthesisResult(job, len(samples) / sample_rate, time.perf_counter() - start, None)
+
+
+def _init_worker(model_path, voices_path, intra_op_threads, inter_op_threads, settings, cache):
+    global _worker_kokoro, _worker_cache
+    _worker_kokoro = load_kokoro(model_path, voices_path, intra_op_threads, inter_op_threads, settings)
+    _worker_cache = cache
+
+
+def _run_in_worker(job):
+    return run_job(_worker_kokoro, job, _worker_cache)
+
+
+class SynthesisReport:
+    """Aggregate outcome of a batch of jobs."""
+
+    def __init__(self, results, wall_seconds):
+        self.results = results
+        self.wall_seconds = wall_seconds
+
+    @property
+    def succeeded(self):
+        return sum(1 for result in self.results if result.error is None)
+
+    @property
+    def failed(self):
+        return len(self.results) - self.succeeded
+
+    @property
+    def audio_seconds(self):
+        return sum(result.audio_seconds for result in self.results)
+
+    @property
+    def real_time_factor(self):
+        """Wall-clock seconds spent per second of audio produced (below 1 is faster than real time)."""
+        return self.wall_seconds / self.audio_seconds if self.audio_seconds else float('inf')
+
+    def summary(self):
+        return (f"{self.succeeded} succeeded, {self.failed} failed: {self.audio_seconds:.1f}s of audio "
+                f"in {self.wall_seconds:.1f}s (real-time factor {self.real_time_factor:.3f})")
+
+
+class ParallelSynthesizer:
+    """Runs synthesis jobs on a pool of workers.
+
+    In 'thread' mode the model is loaded once and shared by all worker threads (onnxruntime
+    sessions can run concurrently). In 'process' mode every worker process loads its own copy,
+    which avoids contention inside one session at the cost of memory. Either way the cores are
+    split between workers, so workers * threads_per_worker doesn't oversubscribe the CPU.
+    An optional AudioCache is shared by all workers, and SessionSettings apply to every session.
+    """
+
+    def __init__(self, model_path, voices_path, workers=None, mode='thread', threads_per_worker=None, cache=None,
+                 inter_op_threads=1, settings=None):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown parallel mode '{mode}' (expected thread or process).")
+        self.mode = mode
+        self.cache = cache
+        self.workers = workers or min(4, available_cpus())
+        self.threads_per_worker = threads_per_worker or max(1, available_cpus() // self.workers)
+        if mode == 'thread':
+            # Concurrent runs share the session's intra-op pool, so it gets all the threads
+            self.kokoro = load_kokoro(model_path, voices_path, self.threads_per_worker * self.workers,
+                                      inter_op_threads, settings)
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tts")
+        else:
+            for path in (model_path, voices_path):
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"File not found at {path}")
+            self.kokoro = None
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker, initargs=(model_path, voices_path, self.threads_per_worker, inter_op_threads, settings, cache),
+            )
+
+    def submit(self, job):
+        """Queues one job and returns a Future for its SynthesisResult."""
+        if self.mode == 'thread':
+            return self._executor.submit(run_job, self.kokoro, job, self.cache)
+        return self._executor.submit(_run_in_worker, job)
+
+    def run(self, jobs, on_result=None):
+        """Synthesizes all jobs, calling on_result(result) as each finishes, and returns a SynthesisReport."""
+        start = time.perf_counter()
+        futures = [self.submit(job) for job in jobs]
+        results = []
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if on_result:
+                on_result(result)
+        return SynthesisReport(results, time.perf_counter() - start)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,6 +1,6 @@
 import soundfile as sf
 import sys
-from kokoro_onnx import Kokoro
+from engine import SessionSettings, int8_model_path, load_kokoro
 
 # --- Configuration ---
 MODEL_FILENAME = "kokoro-v1.0.onnx"
@@ -37,23 +37,32 @@ VOICE_ID = "af_sarah" # Example voice, see https://huggingface.co/hexgrad/Kokoro
 #   pm_alex, pm_santa
 LANGUAGE_CODE = "en-us" # Example language
 SPEED = 1.0
+# --- ONNX Runtime session ---
+USE_INT8_MODEL = False # Use kokoro-v1.0.int8.onnx, the quantized model (smaller, usually faster on CPU)
+INTRA_OP_THREADS = 0 # Threads per operator; 0 uses every core. Lower it when several processes share the machine
+INTER_OP_THREADS = 1 # Only used with the 'parallel' execution mode
+SESSION_SETTINGS = SessionSettings(
+    execution_mode="sequential",
+    graph_optimization="all", # disable, basic, extended or all
+    optimized_model_dir=None, # e.g. ".onnx-cache" to cache the optimized graph and start faster next time
+)
 
 def main():
     """Loads the Kokoro ONNX model and generates audio."""
 
-    print(f"Loading Kokoro model: {MODEL_FILENAME}")
+    model_filename = int8_model_path(MODEL_FILENAME) if USE_INT8_MODEL else MODEL_FILENAME
+    print(f"Loading Kokoro model: {model_filename}")
     print(f"Loading voices: {VOICES_FILENAME}")
 
     try:
         # Initialize Kokoro with model and voice files
-        # The kokoro-onnx package handles ONNX Runtime session creation
-        # and provider selection internally. It should automatically
-        # attempt to use CoreML on macOS if available.
-        kokoro = Kokoro(MODEL_FILENAME, VOICES_FILENAME)
+        # The session uses every available execution provider (e.g. CoreML on macOS)
+        # unless ONNX_PROVIDER names one, with the thread counts and settings above.
+        kokoro = load_kokoro(model_filename, VOICES_FILENAME, INTRA_OP_THREADS, INTER_OP_THREADS, SESSION_SETTINGS)
         print("Kokoro model loaded successfully.")
 
     except FileNotFoundError:
-        print(f"Error: Model file '{MODEL_FILENAME}' or voices file '{VOICES_FILENAME}' not found.", file=sys.stderr)
+        print(f"Error: Model file '{model_filename}' or voices file '{VOICES_FILENAME}' not found.", file=sys.stderr)
         print("Please download them from https://github.com/thewh1teagle/kokoro-onnx/releases", file=sys.stderr)
         sys.exit(1)
     except Exception as e:
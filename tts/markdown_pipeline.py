@@ -0,0 +1,260 @@
+import hashlib
+import os
+import re
+import shutil
+from collections import namedtuple
+
+import numpy as np
+import soundfile as sf
+
+from audio_output import AudioWriter
+from engine import SynthesisJob
+from streaming import SENTENCE_PAUSE_SECONDS
+from text_split import group_sentences, split_sentences
+
+CHAPTER_PAUSE_SECONDS = 1.5 # Silence between chapters in the combined file
+PARTS_DIR = '.parts' # Per-chunk audio inside the chapter directory, removed once assembled
+
+# One chapter: its heading (spoken first) and its plain text
+Chapter = namedtuple('Chapter', ['title', 'text'])
+# Where a chapter starts in the combined file, in seconds
+ChapterMark = namedtuple('ChapterMark', ['title', 'start_seconds', 'end_seconds', 'path'])
+
+HEADING = re.compile(r'^ {0,3}(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+SETEXT_UNDERLINE = re.compile(r'^ {0,3}(=+|-+)\s*$')
+FENCE = re.compile(r'^ {0,3}(```|~~~)')
+RULE = re.compile(r'^ {0,3}([-*_])(\s*\1){2,}\s*$')
+TABLE_SEPARATOR = re.compile(r'^\s*\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?\s*$')
+LIST_MARKER = re.compile(r'^\s*(?:[-*+]|\d+[.)])\s+(?:\[[ xX]\]\s+)?')
+LINK_DEFINITION = re.compile(r'^ {0,3}\[[^\]]+\]:\s+\S+')
+FRONT_MATTER = re.compile(r'\A---\n.*?\n(?:---|\.\.\.)\n', re.S)
+INLINE_RULES = [
+    (re.compile(r'<!--.*?-->', re.S), ''), # HTML comments
+    (re.compile(r'!\[[^\]]*\]\([^)]*\)'), ''), # Images
+    (re.compile(r'\[\^[^\]]+\]'), ''), # Footnote references
+    (re.compile(r'\[([^\]]+)\]\([^)]*\)'), r'\1'), # Links keep their text
+    (re.compile(r'\[([^\]]+)\]\[[^\]]*\]'), r'\1'), # Reference links
+    (re.compile(r'<https?://[^>]+>'), ''), # Autolinks
+    (re.compile(r'https?://\S+'), ''), # Bare URLs
+    (re.compile(r'</?[A-Za-z][^>]*>'), ''), # HTML tags keep their content
+    (re.compile(r'`+([^`]+)`+'), r'\1'), # Inline code
+    (re.compile(r'(\*\*|__)(.+?)\1'), r'\2'), # Bold
+    (re.compile(r'(?<![\w*])([*_])(?!\s)(.+?)(?<!\s)\1(?![\w*])'), r'\2'), # Italics
+    (re.compile(r'~~(.+?)~~'), r'\1'), # Strikethrough
+]
+
+
+def end_sentence(text):
+    """Adds a full stop to a heading, list item or table row, so it is spoken as a sentence."""
+    text = text.strip()
+    return text if not text or text[-1] in '.!?:;…' else f"{text}."
+
+
+def strip_inline(text):
+    for pattern, replacement in INLINE_RULES:
+        text = pattern.sub(replacement, text)
+    return text.replace('\\', '')
+
+
+def _lines_outside_code(lines):
+    """Yields (line, in_code) and marks fence lines themselves as code."""
+    fence = None
+    for line in lines:
+        match = FENCE.match(line)
+        if fence is None and match:
+            fence = match.group(1)
+            yield line, True
+        elif fence is not None:
+            if line.strip().startswith(fence):
+                fence = None
+            yield line, True
+        else:
+            yield line, False
+
+
+def strip_markdown(markdown):
+    """Turns Markdown into plain text for speech: markup and code are dropped, and headings,
+    list items and table rows become sentences of their own. Paragraphs stay separated by
+    blank lines."""
+    lines = []
+    for line, in_code in _lines_outside_code(markdown.splitlines()):
+        if in_code:
+            continue
+        if RULE.match(line) or LINK_DEFINITION.match(line) or TABLE_SEPARATOR.match(line):
+            lines.append('')
+            continue
+        line = re.sub(r'^\s*(>\s?)+', '', line) # Block quotes
+        heading = HEADING.match(line)
+        if heading:
+            lines.extend(['', end_sentence(strip_inline(heading.group(2))), ''])
+        elif '|' in line and line.strip().startswith('|'):
+            cells = [strip_inline(cell).strip() for cell in line.strip().strip('|').split('|')]
+            lines.append(end_sentence(', '.join(cell for cell in cells if cell)))
+        elif LIST_MARKER.match(line):
+            lines.append(end_sentence(strip_inline(LIST_MARKER.sub('', line))))
+        else:
+            lines.append(strip_inline(line))
+    text = '\n'.join(lines)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+def _atx_headings(markdown):
+    """Drops front matter and rewrites setext headings (a line underlined with === or ---) as # headings."""
+    lines = FRONT_MATTER.sub('', markdown).splitlines()
+    in_code = [code for _, code in _lines_outside_code(lines)] + [False]
+    result = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        underline = SETEXT_UNDERLINE.match(lines[index + 1]) if index + 1 < len(lines) else None
+        if (underline and not in_code[index] and not in_code[index + 1] and line.strip()
+                and not (result and result[-1].strip()) # A one-line paragraph, not the end of a longer one
+                and not HEADING.match(line) and not LIST_MARKER.match(line) and not RULE.match(line)):
+            result.append(f"{'#' if underline.group(1)[0] == '=' else '##'} {line.strip()}")
+            index += 2
+        else:
+            result.append(line)
+            index += 1
+    return result
+
+
+def split_chapters(markdown, level=None):
+    """Splits a Markdown document into Chapters at headings of the given level.
+
+    By default the level is the highest one with at least two headings, so a document with a
+    single # title and several ## sections gets one chapter per section. Text before the first
+    chapter heading (such as the title and an introduction) becomes a chapter of its own.
+    """
+    lines = _atx_headings(markdown)
+    headings = [(index, len(match.group(1)), match.group(2))
+                for index, (line, in_code) in enumerate(_lines_outside_code(lines))
+                if not in_code and (match := HEADING.match(line))]
+    if level is None:
+        levels = [heading_level for _, heading_level, _ in headings]
+        repeated = [candidate for candidate in sorted(set(levels)) if levels.count(candidate) > 1]
+        level = repeated[0] if repeated else (min(levels) if levels else 1)
+
+    starts = [(index, strip_inline(title).strip()) for index, heading_level, title in headings if heading_level == level]
+    chapters = []
+    first = starts[0][0] if starts else len(lines)
+    preface = strip_markdown('\n'.join(lines[:first]))
+    if preface:
+        preface_titles = [strip_inline(title).strip() for index, _, title in headings if index < first]
+        chapters.append(Chapter(preface_titles[0] if preface_titles else "Introduction", preface))
+    for number, (start, title) in enumerate(starts):
+        end = starts[number + 1][0] if number + 1 < len(starts) else len(lines)
+        text = strip_markdown('\n'.join(lines[start:end])) # Includes the heading, which is read out
+        if text:
+            chapters.append(Chapter(title or f"Chapter {number + 1}", text))
+    return chapters
+
+
+def safe_filename(title, max_length=60):
+    name = re.sub(r'[^\w\- ]+', '', title).strip()
+    return re.sub(r'\s+', ' ', name)[:max_length].strip() or 'chapter'
+
+
+def chapter_paths(chapters, output_dir, output_format):
+    """Output file of every chapter: <output_dir>/01 - <title>.<format>."""
+    width = max(2, len(str(len(chapters))))
+    return [os.path.join(output_dir, f"{number:0{width}d} - {safe_filename(chapter.title)}.{output_format}")
+            for number, chapter in enumerate(chapters, start=1)]
+
+
+def part_digest(text, voice, lang, speed):
+    """Short hash of what a part is synthesized from, so resume never reuses a part made from other input."""
+    fields = [text, voice, lang, f"{float(speed):g}"]
+    return hashlib.sha256('\0'.join(fields).encode()).hexdigest()[:12]
+
+
+def chapter_jobs(chapters, output_dir, voice, lang, speed, chunk_chars):
+    """Splits every chapter into sentence-grouped SynthesisJobs, written as WAV parts.
+
+    Returns one list of jobs per chapter. Jobs from all chapters go to one worker pool, so a
+    document with a single long chapter still uses every core. Part names include a hash of
+    their text and voice settings: after the Markdown or the settings change, a resumed run
+    synthesizes the affected parts again instead of reusing stale audio.
+    """
+    parts_dir = os.path.join(output_dir, PARTS_DIR)
+    jobs = []
+    for number, chapter in enumerate(chapters, start=1):
+        chunks = group_sentences(split_sentences(chapter.text), chunk_chars)
+        jobs.append([SynthesisJob(chunk, voice, lang, speed, os.path.join(parts_dir, f"{number:04d}_{part:05d}_{part_digest(chunk, voice, lang, speed)}.wav"))
+                     for part, chunk in enumerate(chunks, start=1)])
+    return jobs
+
+
+def _copy_audio(source_path, writers, block_frames=65536):
+    """Streams one part into every writer without loading it whole; returns its length in frames."""
+    frames = 0
+    with sf.SoundFile(source_path) as source:
+        sample_rate = source.samplerate
+        for block in source.blocks(blocksize=block_frames, dtype='float32'):
+            for writer in writers:
+                writer.write(block, sample_rate)
+            frames += len(block)
+    return frames, sample_rate
+
+
+def assemble_audiobook(chapters, jobs, output_dir, book_path, output_format, sample_rate=None):
+    """Joins the synthesized parts into one file per chapter plus the whole book.
+
+    Parts are streamed through the encoders, so memory use doesn't grow with the document.
+    Returns a ChapterMark per chapter with its position in the book file.
+    """
+    marks = []
+    position = 0.0
+    with AudioWriter(book_path, sample_rate) as book:
+        for chapter, parts, path in zip(chapters, jobs, chapter_paths(chapters, output_dir, output_format)):
+            start = position
+            with AudioWriter(path, sample_rate) as chapter_file:
+                for part, job in enumerate(parts):
+                    if part:
+                        pause = np.zeros(int(SENTENCE_PAUSE_SECONDS * rate), dtype=np.float32)
+                        chapter_file.write(pause, rate)
+                        book.write(pause, rate)
+                        position += len(pause) / rate
+                    frames, rate = _copy_audio(job.output_path, [chapter_file, book])
+                    position += frames / rate
+            marks.append(ChapterMark(chapter.title, start, position, path))
+            if len(marks) < len(chapters):
+                pause = np.zeros(int(CHAPTER_PAUSE_SECONDS * rate), dtype=np.float32)
+                book.write(pause, rate)
+                position += len(pause) / rate
+    return marks
+
+
+def cue_time(seconds):
+    """mm:ss:ff with 75 frames per second, as CUE sheets expect."""
+    frames = round(seconds * 75)
+    return f"{frames // 4500:02d}:{frames // 75 % 60:02d}:{frames % 75:02d}"
+
+
+def write_cue_sheet(path, book_path, marks, title):
+    """Writes a CUE sheet with one track per chapter, for players and splitters that read them."""
+    file_type = 'MP3' if book_path.lower().endswith('.mp3') else 'WAVE'
+    lines = [f'TITLE "{title}"', f'FILE "{os.path.basename(book_path)}" {file_type}']
+    for number, mark in enumerate(marks, start=1):
+        lines += [f"  TRACK {number:02d} AUDIO",
+                  f'    TITLE "{mark.title.replace(chr(34), chr(39))}"',
+                  f"    INDEX 01 {cue_time(mark.start_seconds)}"]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_ffmetadata(path, marks, title):
+    """Writes the chapters in FFmpeg metadata format, to embed them with e.g.
+    ffmpeg -i book.flac -i book.chapters.txt -map_metadata 1 -c:a aac book.m4b"""
+    def escape(value):
+        return re.sub(r'([=;#\\\n])', r'\\\1', value)
+
+    lines = [';FFMETADATA1', f"title={escape(title)}"]
+    for mark in marks:
+        lines += ['', '[CHAPTER]', 'TIMEBASE=1/1000', f"START={round(mark.start_seconds * 1000)}",
+                  f"END={round(mark.end_seconds * 1000)}", f"title={escape(mark.title)}"]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def remove_parts(output_dir):
+    shutil.rmtree(os.path.join(output_dir, PARTS_DIR), ignore_errors=True)
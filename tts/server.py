@@ -0,0 +1,344 @@
+"""Local TTS service keeping the Kokoro model warm between requests.
+
+Endpoints:
+    POST /v1/audio/speech   OpenAI-compatible: {"input", "voice", "speed", "response_format"}
+    POST /synthesize        {"text", "voice", "lang", "speed", "format", "stream"}
+    GET  /v1/audio/voices   Available voice IDs
+    GET  /metrics           Queue depth, latency and throughput in Prometheus text format
+    GET  /health
+
+Example:
+    python server.py --port 8880 --workers 2
+    curl -s localhost:8880/v1/audio/speech -d '{"input": "Hello!", "voice": "af_sarah"}' -o hello.wav
+"""
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import soundfile as sf
+
+from audio_cache import DEFAULT_CACHE_MAX_MB, AudioCache
+from audio_output import OUTPUT_FORMATS, output_format
+from cli import add_session_arguments, session_settings
+from engine import available_cpus, load_kokoro, synthesize
+from streaming import SENTENCE_PAUSE_SECONDS, pcm16, stream_audio, wav_stream_header
+
+MAX_REQUEST_BYTES = 1024 * 1024 # Upper bound for a JSON request body
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# response_format -> content type; the encodings are in audio_output.OUTPUT_FORMATS, pcm is handled separately
+AUDIO_FORMATS = {
+    'wav': 'audio/wav',
+    'flac': 'audio/flac',
+    'ogg': 'audio/ogg',
+    'opus': 'audio/ogg',
+    'mp3': 'audio/mpeg',
+}
+
+
+class ServerMetrics:
+    """Counters, gauges and latency histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {} # (name, label string) -> value
+        self.gauges = {'tts_queue_depth': 0, 'tts_in_flight': 0}
+        self.histograms = {} # name -> [bucket counts..., sum, count]
+
+    def inc(self, name, amount=1, labels=''):
+        with self._lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + amount
+
+    def add_gauge(self, name, amount):
+        with self._lock:
+            self.gauges[name] += amount
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.setdefault(name, [0] * len(LATENCY_BUCKETS) + [0.0, 0])
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for bound, count in zip(LATENCY_BUCKETS, histogram):
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {histogram[-1]}')
+                lines.append(f"{name}_sum {histogram[-2]}")
+                lines.append(f"{name}_count {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class SpeechService:
+    """Shares one warm model between request threads.
+
+    At most `workers` syntheses run at once; further requests wait in the queue. Kokoro
+    synthesizes one utterance per inference call, so concurrent requests can't be batched into
+    one model run. Instead identical requests arriving while one is being synthesized are
+    coalesced and all receive the same audio. With an AudioCache, sentences synthesized before
+    (by this or earlier runs) are served from disk.
+    """
+
+    def __init__(self, kokoro, workers, default_voice, default_lang, cache=None):
+        self.kokoro = kokoro
+        self.cache = cache
+        self.workers = workers
+        self.default_voice = default_voice
+        self.default_lang = default_lang
+        self.metrics = ServerMetrics()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._in_flight = {} # Request key -> Future of (samples, sample_rate)
+
+    def resolve_voice(self, voice):
+        """Accepts Kokoro voice IDs and OpenAI-style names such as 'alloy' (af_alloy)."""
+        voice = voice or self.default_voice
+        voices = self.kokoro.get_voices()
+        if voice in voices:
+            return voice
+        matches = [v for v in voices if v.split('_', 1)[-1] == voice]
+        if not matches:
+            raise ValueError(f"Unknown voice '{voice}'.")
+        return matches[0]
+
+    @contextmanager
+    def _slot(self):
+        """Holds a synthesis slot, counting the request in the queue depth while it waits."""
+        self.metrics.add_gauge('tts_queue_depth', 1)
+        self._slots.acquire()
+        self.metrics.add_gauge('tts_queue_depth', -1)
+        self.metrics.add_gauge('tts_in_flight', 1)
+        try:
+            yield
+        finally:
+            self.metrics.add_gauge('tts_in_flight', -1)
+            self._slots.release()
+
+    def synthesize(self, text, voice, lang, speed):
+        """Returns (samples, sample_rate), sharing the work with identical concurrent requests."""
+        key = (text, voice, lang, speed)
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            self.metrics.inc('tts_coalesced_requests_total')
+            return future.result()
+        try:
+            with self._slot():
+                if self.cache is not None:
+                    result = self.cache.synthesize(self.kokoro, text, voice, lang, speed)
+                else:
+                    result = synthesize(self.kokoro, text, voice, lang, speed)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def render_metrics(self):
+        text = self.metrics.render()
+        if self.cache is not None:
+            text += (f"tts_cache_sentence_hits_total {self.cache.hits}\n"
+                     f"tts_cache_sentence_misses_total {self.cache.misses}\n")
+        return text
+
+    def stream(self, text, voice, lang, speed):
+        """Yields (samples, sample_rate) per sentence chunk, holding a synthesis slot throughout."""
+        with self._slot():
+            yield from stream_audio(self.kokoro, text, voice, lang, speed)
+
+
+def encode_audio(samples, sample_rate, response_format):
+    """Returns (body bytes, content type) for a complete utterance."""
+    if response_format == 'pcm':
+        return pcm16(samples), 'audio/pcm'
+    sf_format, subtype = OUTPUT_FORMATS[response_format]
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format=sf_format, subtype=subtype)
+    return buffer.getvalue(), AUDIO_FORMATS[response_format]
+
+
+class SpeechRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Needed for chunked streaming responses
+    service = None # Set by serve()
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/health':
+            self._send(200, b'ok\n', 'text/plain')
+        elif path == '/metrics':
+            self._send(200, self.service.render_metrics().encode('utf-8'), 'text/plain; version=0.0.4')
+        elif path in ('/voices', '/v1/audio/voices'):
+            self._send_json(200, {"voices": self.service.kokoro.get_voices()})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        if path not in ('/v1/audio/speech', '/synthesize'):
+            self._send_json(404, {"error": "Not found"})
+            return
+        start = time.perf_counter()
+        status = 500
+        self._streaming = False
+        try:
+            request = self._read_json()
+            openai = path == '/v1/audio/speech'
+            text = (request.get('input') if openai else request.get('text')) or ''
+            if not text.strip():
+                raise ValueError("No text to synthesize.")
+            voice = self.service.resolve_voice(request.get('voice'))
+            lang = request.get('lang') or self.service.default_lang
+            speed = float(request.get('speed') or 1.0)
+            response_format = (request.get('response_format') if openai else request.get('format')) or 'wav'
+            if response_format != 'pcm' and response_format not in AUDIO_FORMATS:
+                raise ValueError(f"Unsupported format '{response_format}'.")
+            if response_format != 'pcm':
+                output_format(f"speech.{response_format}") # Raises if this libsndfile can't encode it
+            if request.get('stream') and response_format not in ('wav', 'pcm'):
+                raise ValueError("Streaming supports the wav and pcm formats only.")
+        except (ValueError, TypeError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            self.service.metrics.inc('tts_requests_total', labels='status="400"')
+            return
+
+        try:
+            if request.get('stream'):
+                self._stream(text, voice, lang, speed, response_format, start)
+            else:
+                samples, sample_rate = self.service.synthesize(text, voice, lang, speed)
+                body, content_type = encode_audio(samples, sample_rate, response_format)
+                self.service.metrics.inc('tts_audio_seconds_total', len(samples) / sample_rate)
+                self._send(200, body, content_type)
+            status = 200
+        except (BrokenPipeError, ConnectionResetError):
+            status = 499 # Client went away
+        except Exception as e:
+            print(f"Synthesis failed: {e}", file=sys.stderr)
+            if self._streaming:
+                self.close_connection = True # Headers are out; the truncated stream is all the client gets
+            else:
+                self._send_json(500, {"error": str(e)})
+        finally:
+            self.service.metrics.inc('tts_requests_total', labels=f'status="{status}"')
+            self.service.metrics.observe('tts_request_seconds', time.perf_counter() - start)
+
+    def _stream(self, text, voice, lang, speed, response_format, start):
+        """Sends audio with chunked transfer encoding as each sentence is synthesized."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/wav' if response_format == 'wav' else 'audio/pcm')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._streaming = True
+        first = True
+        for samples, sample_rate in self.service.stream(text, voice, lang, speed):
+            data = pcm16(samples)
+            if first:
+                self.service.metrics.observe('tts_time_to_first_audio_seconds', time.perf_counter() - start)
+                if response_format == 'wav':
+                    data = wav_stream_header(sample_rate) + data
+                first = False
+            else:
+                data = pcm16(np.zeros(int(SENTENCE_PAUSE_SECONDS * sample_rate), dtype=samples.dtype)) + data
+            self.service.metrics.inc('tts_audio_seconds_total', len(samples) / sample_rate)
+            self._write_chunk(data)
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_REQUEST_BYTES:
+            raise ValueError("Request body too large.")
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not isinstance(request, dict):
+            raise ValueError("Request body must be a JSON object.")
+        return request
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}", file=sys.stderr)
+
+
+def serve(service, host, port):
+    """Serves requests until interrupted."""
+    SpeechRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), SpeechRequestHandler)
+    server.daemon_threads = True
+    print(f"Serving TTS on http://{host}:{port} with {service.workers} synthesis worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Kokoro TTS over HTTP with the model kept in memory.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1; use 0.0.0.0 for containers).")
+    parser.add_argument("--port", type=int, default=8880, help="Port to listen on (default: 8880).")
+    parser.add_argument("--workers", type=int, default=0, help="Syntheses running at once (default: up to 4, limited by CPU cores).")
+    parser.add_argument("--voice", default="af_sarah", help="Voice used when a request names none (default: af_sarah).")
+    parser.add_argument("--lang", default="en-us", help="Language used when a request names none (default: en-us).")
+    parser.add_argument("--model", default="kokoro-v1.0.onnx", help="Path to the Kokoro model file (default: kokoro-v1.0.onnx).")
+    parser.add_argument("--voices", default="voices-v1.0.bin", help="Path to the voices file (default: voices-v1.0.bin).")
+    add_session_arguments(parser)
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads, shared by concurrent syntheses (default: all CPU cores).")
+    parser.add_argument("--cache-dir", help="Directory of cached sentence audio, reused across requests and restarts (default: no cache).")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_MB, help=f"Size limit of the audio cache (default: {DEFAULT_CACHE_MAX_MB}).")
+    args = parser.parse_args()
+    settings = session_settings(args)
+
+    workers = args.workers or min(4, available_cpus())
+    print(f"Loading Kokoro model: {args.model}")
+    print(f"Loading voices: {args.voices}")
+    try:
+        kokoro = load_kokoro(args.model, args.voices, args.threads or available_cpus(), args.inter_op_threads, settings)
+        cache = AudioCache(args.cache_dir, args.model, args.voices, int(args.cache_max_mb * 1024 * 1024)) if args.cache_dir else None
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        print("Please download the model files from https://github.com/thewh1teagle/kokoro-onnx/releases", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error initializing Kokoro: {e}", file=sys.stderr)
+        sys.exit(1)
+    print("Kokoro model loaded successfully.")
+    serve(SpeechService(kokoro, workers, args.voice, args.lang, cache), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare ONNX Runtime session settings for Kokoro on CPU.
+
+Every combination of model variant, intra-op thread count, graph optimization level and
+execution mode runs in a fresh process, so its load time and peak memory are measured
+independently. Each one loads the model, warms up, then synthesizes the same text with a
+few voices one after another.
+
+Example:
+    python session_benchmark.py --threads 1,2,4 --optimization basic,all --int8
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Benchmark the CPU provider unless told otherwise; the child processes inherit this
+os.environ.setdefault('ONNX_PROVIDER', 'CPUExecutionProvider')
+
+from benchmark import DEFAULT_BENCHMARK_TEXT
+from cli import ALL_ENGLISH_VOICES
+from engine import (EXECUTION_MODES, GRAPH_OPTIMIZATION_LEVELS, SessionSettings, available_cpus, int8_model_path,
+                    load_kokoro, synthesize)
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024 # Bytes on macOS, KiB on Linux
+
+
+def run_setting(model_path, voices_path, text, voices, intra_op_threads, inter_op_threads, settings):
+    """Runs in a fresh process: returns (load seconds, wall seconds, audio seconds, peak memory in MB)."""
+    start = time.perf_counter()
+    kokoro = load_kokoro(model_path, voices_path, intra_op_threads, inter_op_threads, settings)
+    load_seconds = time.perf_counter() - start
+    synthesize(kokoro, "Warm up.", voices[0], "en-us", 1.0)
+
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    for voice in voices:
+        samples, sample_rate = synthesize(kokoro, text, voice, "en-us", 1.0)
+        audio_seconds += len(samples) / sample_rate
+    return load_seconds, time.perf_counter() - start, audio_seconds, peak_memory_mb()
+
+
+def parse_list(value, convert=str):
+    return [convert(item.strip()) for item in value.split(',') if item.strip()]
+
+
+def main():
+    cpus = available_cpus()
+    parser = argparse.ArgumentParser(description="Compare ONNX Runtime session settings for Kokoro on CPU.")
+    parser.add_argument("--model", default="kokoro-v1.0.onnx", help="Path to the Kokoro model file (default: kokoro-v1.0.onnx).")
+    parser.add_argument("--voices", default="voices-v1.0.bin", help="Path to the voices file (default: voices-v1.0.bin).")
+    parser.add_argument("--text", default=DEFAULT_BENCHMARK_TEXT, help="Text to synthesize with every voice.")
+    parser.add_argument("--voice-count", type=int, default=3, help="Number of English voices to synthesize per setting (default: 3).")
+    parser.add_argument("--int8", action="store_true", help="Also benchmark the int8-quantized model next to --model.")
+    parser.add_argument("--threads", default=f"1,{max(1, cpus // 2)},{cpus}", help=f"Comma-separated intra-op thread counts (default: 1, half and all of the {cpus} cores).")
+    parser.add_argument("--optimization", default="basic,all", help=f"Comma-separated graph optimization levels: {', '.join(GRAPH_OPTIMIZATION_LEVELS)} (default: basic,all).")
+    parser.add_argument("--execution-modes", default="sequential", help="Comma-separated execution modes: sequential, parallel (default: sequential).")
+    parser.add_argument("--inter-op-threads", type=int, default=2, help="Inter-op threads for the parallel execution mode (default: 2).")
+    parser.add_argument("--optimized-model-dir", help="Cache optimized graphs here; the load times then show the cached start-up after the first run.")
+    args = parser.parse_args()
+
+    models = [args.model] + ([int8_model_path(args.model)] if args.int8 else [])
+    threads = sorted(set(parse_list(args.threads, int)))
+    levels = parse_list(args.optimization)
+    modes = parse_list(args.execution_modes)
+    unknown = [value for value in levels if value not in GRAPH_OPTIMIZATION_LEVELS] + \
+              [value for value in modes if value not in EXECUTION_MODES]
+    if unknown:
+        parser.error(f"Unknown optimization level or execution mode: {', '.join(unknown)}")
+    for path in models + [args.voices]:
+        if not os.path.exists(path):
+            print(f"Error: File not found at {path}", file=sys.stderr)
+            sys.exit(1)
+
+    voices = ALL_ENGLISH_VOICES[:args.voice_count]
+    print(f"{len(voices)} voices, {cpus} CPU core(s), provider {os.environ['ONNX_PROVIDER']}")
+    print(f"{'model':<28} {'threads':>7} {'optimization':>12} {'mode':>10} {'load':>7} {'wall':>7} {'RTF':>7} {'peak MB':>8}")
+    context = multiprocessing.get_context('spawn')
+    for model_path, intra_op_threads, level, mode in itertools.product(models, threads, levels, modes):
+        settings = SessionSettings(mode, level, args.optimized_model_dir)
+        inter_op_threads = args.inter_op_threads if mode == 'parallel' else 1
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                load_seconds, wall_seconds, audio_seconds, peak_mb = executor.submit(
+                    run_setting, model_path, args.voices, args.text, voices,
+                    intra_op_threads, inter_op_threads, settings).result()
+            except Exception as e:
+                print(f"{os.path.basename(model_path):<28} {intra_op_threads:>7} {level:>12} {mode:>10}  failed: {e}",
+                      file=sys.stderr)
+                continue
+        print(f"{os.path.basename(model_path):<28} {intra_op_threads:>7} {level:>12} {mode:>10} "
+              f"{load_seconds:6.2f}s {wall_seconds:6.2f}s {wall_seconds / audio_seconds:7.3f} {peak_mb:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from audio_output import AudioWriter
+from engine import synthesize
+from text_split import group_sentences, split_long, split_sentences
+
+FIRST_CHUNK_CHARS = 80 # The first chunk is kept short so audio starts quickly
+STREAM_CHUNK_CHARS = 300 # Later chunks group whole sentences up to this length
+SENTENCE_PAUSE_SECONDS = 0.25 # Kokoro trims each chunk's silence, so the pause between sentences is added back
+
+# Timings of one streamed synthesis, all in seconds
+StreamStats = namedtuple('StreamStats', ['first_audio_seconds', 'audio_seconds', 'total_seconds'])
+
+
+def stream_chunks(text, max_chars=STREAM_CHUNK_CHARS, first_chars=FIRST_CHUNK_CHARS):
+    """Splits text into synthesis chunks: a short first phrase, then groups of whole sentences."""
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    first = split_long(sentences[0], first_chars)
+    return first[:1] + group_sentences(first[1:] + sentences[1:], max_chars)
+
+
+def stream_audio(kokoro, text, voice, lang, speed):
+    """Yields (samples, sample_rate) per chunk of text.
+
+    The next chunk is synthesized on a background thread while the caller writes the current
+    one, and at most one finished chunk waits in between, so memory stays flat for any length.
+    """
+    results = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in stream_chunks(text):
+                if stop.is_set():
+                    return
+                results.put(synthesize(kokoro, chunk, voice, lang, speed))
+        except Exception as e:
+            results.put(e) # Hand the failure to the consumer instead of leaving it waiting
+            return
+        results.put(None)
+
+    producer = threading.Thread(target=produce, name="tts-stream", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # The consumer may stop early: let the producer finish its current chunk and exit
+        stop.set()
+        while producer.is_alive():
+            try:
+                results.get_nowait()
+            except queue.Empty:
+                producer.join(0.05)
+
+
+def pcm16(samples):
+    """Converts float samples in [-1, 1] to 16-bit little-endian PCM bytes."""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def wav_stream_header(sample_rate, channels=1, bits=16):
+    """WAV header for a stream of unknown length; players read until the data ends."""
+    unknown = 0xFFFFFFFF
+    byte_rate = sample_rate * channels * bits // 8
+    return (b'RIFF' + struct.pack('<I', unknown) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, sample_rate, byte_rate, channels * bits // 8, bits)
+            + b'data' + struct.pack('<I', unknown))
+
+
+def stream_to_callback(kokoro, text, voice, lang, speed, write):
+    """Feeds every chunk (with sentence pauses) to write(samples, sample_rate) and returns StreamStats."""
+    start = time.perf_counter()
+    first_audio = None
+    audio_samples = 0
+    sample_rate = None
+    for samples, sample_rate in stream_audio(kokoro, text, voice, lang, speed):
+        if first_audio is None:
+            first_audio = time.perf_counter() - start
+        else:
+            pause = np.zeros(int(SENTENCE_PAUSE_SECONDS * sample_rate), dtype=samples.dtype)
+            write(pause, sample_rate)
+            audio_samples += len(pause)
+        write(samples, sample_rate)
+        audio_samples += len(samples)
+    audio_seconds = audio_samples / sample_rate if sample_rate else 0.0
+    return StreamStats(first_audio or 0.0, audio_seconds, time.perf_counter() - start)
+
+
+def stream_to_file(kokoro, text, voice, lang, speed, output_path, output_rate=None):
+    """Synthesizes text chunk by chunk into an audio file that is encoded as it grows.
+
+    The format follows the extension (see audio_output.py); output_rate resamples on the way.
+    """
+    with AudioWriter(output_path, output_rate) as writer:
+        return stream_to_callback(kokoro, text, voice, lang, speed, writer.write)
+
+
+def stream_to_pipe(kokoro, text, voice, lang, speed, stream, raw=False):
+    """Synthesizes text chunk by chunk to a binary stream (e.g. stdout) as 16-bit PCM, in a WAV container unless raw."""
+    header_written = raw
+
+    def write(samples, sample_rate):
+        nonlocal header_written
+        if not header_written:
+            stream.write(wav_stream_header(sample_rate))
+            header_written = True
+        stream.write(pcm16(samples))
+        stream.flush()
+
+    return stream_to_callback(kokoro, text, voice, lang, speed, write)
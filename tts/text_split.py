@@ -0,0 +1,47 @@
+import re
+
+# A sentence ends at ., ! or ? (optionally followed by a closing quote or bracket) before whitespace
+SENTENCE_END = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["\'”’)\]]))\s+')
+# Places where an overlong sentence can be broken without cutting a word
+PHRASE_END = re.compile(r'(?<=[,;:—–])\s+')
+
+
+def split_sentences(text):
+    """Splits text into sentences, treating blank lines (paragraph breaks) as sentence ends too."""
+    sentences = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = ' '.join(paragraph.split())
+        sentences.extend(s.strip() for s in SENTENCE_END.split(paragraph) if s.strip())
+    return sentences
+
+
+def split_long(sentence, max_chars):
+    """Breaks a sentence longer than max_chars at phrase boundaries, then at spaces."""
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces = []
+    for phrase in PHRASE_END.split(sentence):
+        while len(phrase) > max_chars:
+            cut = phrase.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(phrase[:cut].strip())
+            phrase = phrase[cut:].strip()
+        if phrase:
+            pieces.append(phrase)
+    return group_sentences(pieces, max_chars)
+
+
+def group_sentences(sentences, max_chars):
+    """Joins consecutive sentences into chunks of at most max_chars (longer sentences are split)."""
+    chunks = []
+    current = ''
+    for sentence in sentences:
+        for piece in split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence]:
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,152 @@
+"""Memory-mapped access to Kokoro voice files, and precomputed voice blends.
+
+A voices file (voices-v1.0.bin) is an uncompressed .npz archive with one style array per voice.
+VoiceStore maps each array straight out of the archive, so a voice costs nothing until it is
+used, only the rows synthesis reads are paged in, and worker processes on one host share those
+pages through the OS page cache instead of each holding a private copy.
+
+Blends are written to the same format, so a blended voice is used like any other:
+    python voice_store.py voices-v1.0.bin --blend af_mix=af_sarah:0.6,af_bella:0.4 --output voices-custom.bin
+    python cli.py --voices voices-custom.bin --voice af_mix --text "Hello"
+"""
+import argparse
+import os
+import struct
+import sys
+import threading
+import zipfile
+from collections.abc import Mapping
+
+import numpy as np
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3I2H') # Fixed part of a zip local file header
+
+
+def _stored_array_offset(f, info):
+    """Returns (offset, shape, dtype, fortran_order) of the .npy data of an uncompressed zip member."""
+    f.seek(info.header_offset)
+    header = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+    name_length, extra_length = header[-2:]
+    f.seek(info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype.hasobject:
+        raise ValueError(f"{info.filename} holds Python objects, not a style array.")
+    return f.tell(), shape, dtype, fortran_order
+
+
+class VoiceStore(Mapping):
+    """Read-only mapping of voice name -> style array, memory-mapped from a voices file.
+
+    Arrays stored compressed can't be mapped; they are read on first use and kept in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._members = {}
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.filename.endswith('.npy'):
+                    self._members[info.filename[:-4]] = info
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            info = self._members[name] # KeyError for unknown voices, as with a dict
+            with self._lock:
+                array = self._arrays.get(name)
+                if array is None:
+                    array = self._arrays[name] = self._load(info)
+        return array
+
+    def _load(self, info):
+        if info.compress_type != zipfile.ZIP_STORED:
+            with zipfile.ZipFile(self.path) as archive, archive.open(info) as f:
+                return np.lib.format.read_array(f)
+        with open(self.path, 'rb') as f:
+            offset, shape, dtype, fortran_order = _stored_array_offset(f, info)
+        return np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                         order='F' if fortran_order else 'C')
+
+    def __iter__(self):
+        return iter(self._members)
+
+    def __len__(self):
+        return len(self._members)
+
+    def __contains__(self, name):
+        return name in self._members
+
+
+def blend_voices(voices, weights):
+    """Mixes styles as a weighted average; weights maps voice name -> weight."""
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Blend weights must add up to more than zero.")
+    blend = sum(np.asarray(voices[name], dtype=np.float32) * (weight / total) for name, weight in weights.items())
+    return blend.astype(np.float32)
+
+
+def parse_blend(spec):
+    """Parses 'name=voice:weight,voice:weight' into (name, {voice: weight})."""
+    name, sep, parts = spec.partition('=')
+    if not sep or not name or not parts:
+        raise ValueError(f"Invalid blend '{spec}' (expected name=voice:weight,voice:weight).")
+    weights = {}
+    for part in parts.split(','):
+        voice, _, weight = part.partition(':')
+        weights[voice.strip()] = float(weight) if weight else 1.0
+    return name.strip(), weights
+
+
+def write_voices(path, voices):
+    """Writes voice name -> style array to an uncompressed voices file, so it can be memory-mapped."""
+    partial_path = f"{path}.part"
+    with open(partial_path, 'wb') as f: # A file object stops numpy from adding .npz to the name
+        np.savez(f, **{name: np.asarray(style, dtype=np.float32) for name, style in voices.items()})
+    os.replace(partial_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the voices in a Kokoro voices file, or write a copy with precomputed blends.")
+    parser.add_argument("voices", help="Voices file to read (e.g. voices-v1.0.bin).")
+    parser.add_argument("--blend", action="append", default=[], metavar="NAME=VOICE:WEIGHT,...", help="Add a blended voice, e.g. af_mix=af_sarah:0.6,af_bella:0.4. Can be repeated.")
+    parser.add_argument("--output", help="Voices file to write with the original voices plus the blends (uncompressed, so it can be memory-mapped).")
+    args = parser.parse_args()
+
+    try:
+        store = VoiceStore(args.voices)
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"Error reading voices file '{args.voices}': {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not args.output:
+        if args.blend:
+            parser.error("--blend needs --output.")
+        for name in sorted(store):
+            print(name)
+        return
+
+    voices = dict(store)
+    try:
+        for spec in args.blend:
+            name, weights = parse_blend(spec)
+            missing = [voice for voice in weights if voice not in store]
+            if missing:
+                raise ValueError(f"Unknown voice(s) in blend '{name}': {', '.join(missing)}")
+            voices[name] = blend_voices(store, weights)
+            print(f"Blended {name} from {', '.join(f'{voice} ({weight:g})' for voice, weight in weights.items())}")
+        write_voices(args.output, voices)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Wrote {len(voices)} voices to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
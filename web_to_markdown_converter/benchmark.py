@@ -0,0 +1,139 @@
+"""Compare the plain HTTP fetcher with the browser on static pages served locally.
+
+Serves generated documentation-like pages from a local HTTP server, then converts all of them
+with each fetcher in a fresh process, so neither one's start-up or memory leaks into the other.
+Reports per-page latency, throughput and the peak memory of the process and everything it
+started (for the browser fetcher, that includes Chromium).
+
+    uv run python benchmark.py --pages 200 --concurrency 4
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+from main import DomainLimiter, Fetcher, LazyCrawler, create_http_client
+
+PARAGRAPH = ("Static site generators turn a tree of Markdown files into plain HTML pages that any web server "
+             "can deliver without running code for each request, which keeps them fast and easy to cache. ")
+
+# Writes pages like a documentation site's: navigation, a heading, paragraphs, a list and a code block
+def write_pages(directory: str, count: int) -> list[str]:
+    names = []
+    for number in range(count):
+        name = f"page{number}.html"
+        nav = ''.join(f'<li><a href="page{(number + step) % count}.html">Page {(number + step) % count}</a></li>' for step in range(1, 20))
+        body = ''.join(f"<h2>Section {section}</h2><p>{PARAGRAPH * 4}</p><ul><li>One</li><li>Two</li></ul>"
+                       f"<pre><code>print('section {section}')</code></pre>" for section in range(8))
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+            f.write(f"<!DOCTYPE html><html><head><title>Page {number}</title></head><body>"
+                    f"<nav><ul>{nav}</ul></nav><main><h1>Page {number}</h1>{body}</main></body></html>")
+        names.append(name)
+    return names
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def start_server(directory: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Samples the resident memory of this process and all of its descendants until stopped
+class MemorySampler(threading.Thread):
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        process = psutil.Process()
+        while not self._stop_event.is_set():
+            total = 0
+            for member in [process] + process.children(recursive=True):
+                try:
+                    total += member.memory_info().rss
+                except psutil.Error:
+                    pass # Exited between listing and sampling
+            self.peak = max(self.peak, total)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+async def convert_all(mode: str, urls: list[str], concurrency: int) -> list[float]:
+    latencies = []
+    async with LazyCrawler() as crawler, create_http_client(concurrency) as client:
+        fetcher = Fetcher(crawler, client, DomainLimiter(concurrency, concurrency), mode)
+
+        slots = asyncio.Semaphore(concurrency) # Started only when a slot is free, so latency excludes queueing
+
+        async def convert(url):
+            async with slots:
+                start = time.perf_counter()
+                await fetcher.fetch(url)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(convert(url) for url in urls))
+    return latencies
+
+# Runs in a fresh process: returns (per-page latencies, wall seconds, peak memory in MB)
+def run_fetcher(mode: str, urls: list[str], concurrency: int) -> tuple[list[float], float, float]:
+    sampler = MemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        latencies = asyncio.run(convert_all(mode, urls, concurrency))
+    finally:
+        sampler.stop()
+    return latencies, time.perf_counter() - start, sampler.peak / (1024 * 1024)
+
+def percentile(values: list[float], p: int) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the plain HTTP fetcher with the browser on locally served static pages.')
+    parser.add_argument('--pages', type=int, default=100, help='Number of pages to convert (default: 100).')
+    parser.add_argument('--concurrency', type=int, default=4, help='Pages converted at once (default: 4).')
+    parser.add_argument('--fetchers', default='http,browser', help='Comma-separated fetchers to compare (default: http,browser).')
+    args = parser.parse_args()
+    modes = [mode.strip() for mode in args.fetchers.split(',') if mode.strip()]
+
+    with tempfile.TemporaryDirectory() as directory:
+        names = write_pages(directory, args.pages)
+        server = start_server(directory)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        urls = [f"{base_url}/{name}" for name in names]
+        print(f"{len(urls)} static pages from {base_url}, {args.concurrency} at a time")
+        print(f"{'fetcher':<8} {'wall':>8} {'pages/s':>8} {'mean':>8} {'p50':>8} {'p95':>8} {'peak MB':>8}")
+        context = multiprocessing.get_context('spawn')
+        try:
+            for mode in modes:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    try:
+                        latencies, wall_seconds, peak_mb = executor.submit(run_fetcher, mode, urls, args.concurrency).result()
+                    except Exception as e:
+                        print(f"{mode:<8} failed: {e}", file=sys.stderr)
+                        continue
+                print(f"{mode:<8} {wall_seconds:7.2f}s {len(urls) / wall_seconds:8.1f} "
+                      f"{statistics.mean(latencies) * 1000:6.0f}ms {percentile(latencies, 50) * 1000:6.0f}ms "
+                      f"{percentile(latencies, 95) * 1000:6.0f}ms {peak_mb:8.0f}")
+        finally:
+            server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,44 @@
 import argparse
 import asyncio
+import functools
+import hashlib
+import json
 import sys
+import time
+from typing import NamedTuple
+import httpx
 from playwright._impl import _errors as PlaywrightErrors
-from crawl4ai import AsyncWebCrawler
+from crawl4ai import AsyncWebCrawler, BrowserConfig, CrawlerRunConfig
+from crawl4ai.models import CrawlResult, CrawlResultContainer
+from crawl4ai.content_scraping_strategy import LXMLWebScrapingStrategy
+from crawl4ai.markdown_generation_strategy import DefaultMarkdownGenerator
+from crawl4ai.utils import RobotsParser
 import os
 import re
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+DEFAULT_CONCURRENCY = 5 # Pages rendered at once in batch mode, all in one browser
+DEFAULT_PER_DOMAIN = 2 # Pages fetched at once from any single host, to stay polite
+DEFAULT_MAX_DEPTH = 3 # Site crawl: link hops from the start page
+DEFAULT_MAX_PAGES = 200 # Site crawl: pages saved at most
+HTTP_TIMEOUT = 15 # Seconds for a plain HTTP request, without the browser
+FETCHERS = ('auto', 'http', 'browser')
+OUTPUT_FORMATS = ('markdown', 'jsonl')
+MIN_STATIC_WORDS = 50 # Auto fetcher: pages with scripts and less text than this are rendered in the browser
+DEFAULT_REMOTE_TASKS = 5 # Remote mode: crawl jobs at once, the server's MAX_CONCURRENT_TASKS in docker-compose.yml
+DEFAULT_REMOTE_BATCH = 10 # Remote mode: URLs sent in one job
+BATCH_WINDOW = 0.05 # Remote mode: seconds to wait for more URLs before sending a job that isn't full
+POLL_INTERVAL = 1.0 # Remote mode: seconds between status requests for a queued job
+REMOTE_TIMEOUT = 300 # Remote mode: seconds for a job, which may wait behind others on the server
+# Progress note for how a page was fetched
+FETCH_NOTES = {'cache': 'unchanged', 'http': 'static', 'browser': 'browser'}
+# Signs that a page fetched without a browser is only a shell filled in by JavaScript
+EMPTY_APP_ROOT = re.compile(r'<(div|main)\b[^>]*\bid=["\']?(?:root|app|__next|__nuxt|svelte)\b[^>]*>\s*</\1>|<app-root\b[^>]*>\s*</app-root>', re.I)
+NOSCRIPT_NOTICE = re.compile(r'<noscript\b[^>]*>(?:(?!</noscript>).)*?\bjavascript\b', re.I | re.S)
+SCRIPT_TAG = re.compile(r'<script\b', re.I)
+# Site crawl: links to files like these are never followed
+SKIPPED_EXTENSIONS = ('.pdf', '.zip', '.gz', '.tar', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico',
+                      '.mp3', '.mp4', '.webm', '.css', '.js', '.json', '.xml', '.exe', '.dmg')
 
 # Helper function to sanitize URL into a filename
 def sanitize_url_to_filename(url: str, extension: str) -> str:
@@ -26,82 +60,715 @@ def sanitize_url_to_filename(url: str, extension: str) -> str:
         name += f'.{extension}'
     return name
 
+# Picks the best content of a crawl result: (content, source format, file extension), or None
+def extract_content(actual_result):
+    if hasattr(actual_result, 'markdown_v2') and actual_result.markdown_v2:
+        return actual_result.markdown_v2, "markdown_v2", "md"
+    if hasattr(actual_result, 'markdown') and actual_result.markdown:
+        return actual_result.markdown, "markdown", "md"
+    if hasattr(actual_result, 'fit_markdown') and actual_result.fit_markdown:
+        return actual_result.fit_markdown, "fit_markdown", "md"
+    if hasattr(actual_result, 'html') and actual_result.html:
+        return actual_result.html, "HTML (fallback)", "html"
+    return None
+
+def write_output(path: str, source_format: str, content) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"--- Source: {source_format} ---\n")
+        f.write(str(content))
+
+# Where converted pages go: a file per page (named after its URL in output_dir, or the -o path for a single page),
+# or one stream - stdout for '-', or the -o file - that gets every page, as Markdown with headers or as JSONL records
+class PageWriter:
+    def __init__(self, output: str | None = None, output_dir: str = '.', output_format: str = 'markdown', single: bool = False):
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.path = None
+        self.stream = None
+        if output == '-' or (output is None and output_format == 'jsonl'):
+            sys.stdout.reconfigure(encoding='utf-8')
+            self.stream = sys.stdout
+        elif output and (output_format == 'jsonl' or not single):
+            directory = os.path.dirname(output)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.stream = open(output, 'w', encoding='utf-8')
+        else:
+            self.path = output
+        self.name = 'stdout' if self.stream is sys.stdout else output
+        # Progress messages go to stderr when stdout carries the pages
+        self.log = sys.stderr if self.stream is sys.stdout else sys.stdout
+
+    @property
+    def to_files(self) -> bool:
+        return self.stream is None
+
+    # Writes one page and returns where it went
+    def save(self, url: str, source_format: str, content, extension: str) -> str:
+        if self.stream is None:
+            path = self.path or os.path.join(self.output_dir, sanitize_url_to_filename(url, extension))
+            write_output(path, source_format, content)
+            return path
+        if self.output_format == 'jsonl':
+            record = {'url': url, 'source_format': source_format, 'markdown': str(content)}
+            self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        else:
+            self.stream.write(f"--- URL: {url} ---\n--- Source: {source_format} ---\n{content}\n")
+        self.stream.flush() # Readers can start on a page as soon as it is done, not when the batch ends
+        return self.name
+
+    def close(self) -> None:
+        if self.stream is not None and self.stream is not sys.stdout:
+            self.stream.close()
+
+# Reads one URL per line from a file, or from stdin for '-'. Blank lines and '#' comments are skipped.
+def read_url_list(path: str) -> list[str]:
+    if path == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    urls = [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+    return list(dict.fromkeys(urls)) # Drop duplicates, keep the order
+
+# Bounds concurrent page loads overall and per host
+class DomainLimiter:
+    def __init__(self, concurrency: int, per_domain: int):
+        self.total = asyncio.Semaphore(concurrency)
+        self.per_domain = per_domain
+        self.domains: dict[str, asyncio.Semaphore] = {}
+
+    def for_url(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        if host not in self.domains:
+            self.domains[host] = asyncio.Semaphore(self.per_domain)
+        return self.domains[host]
+
+async def crawl_url(crawler, url: str, limiter: DomainLimiter, config=None):
+    # The host slot is taken first, so pages waiting on a busy host don't hold a global slot
+    async with limiter.for_url(url):
+        async with limiter.total:
+            result_container = await crawler.arun(url=url, config=config)
+    if not result_container or not getattr(result_container, '_results', None):
+        raise RuntimeError("No result returned from crawler.")
+    actual_result = result_container._results[0]
+    if getattr(actual_result, 'success', True) is False:
+        raise RuntimeError(actual_result.error_message or "Crawl failed.")
+    return actual_result
+
+# Starts the browser on first use, so a run served entirely from the cache never launches it
+class LazyCrawler:
+    def __init__(self):
+        self._crawler = None
+        self._start_error = None
+        self._starting = asyncio.Lock()
+
+    async def arun(self, url: str, config=None):
+        async with self._starting:
+            if self._start_error is not None:
+                raise self._start_error # Pages waiting for the browser fail like the first one, without retrying
+            if self._crawler is None:
+                try:
+                    self._crawler = await AsyncWebCrawler().start()
+                except Exception as e:
+                    self._start_error = e
+                    raise
+        return await self._crawler.arun(url=url, config=config)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._crawler is not None:
+            await self._crawler.close()
+
+# A crawl result from a crawl4ai server's JSON, whether the server's crawl4ai is older or newer than ours
+def result_from_record(record: dict) -> CrawlResult:
+    markdown = record.get('markdown_v2') if isinstance(record.get('markdown_v2'), dict) else record.get('markdown')
+    if isinstance(markdown, str):
+        markdown = {'raw_markdown': markdown, 'markdown_with_citations': '', 'references_markdown': ''}
+    fields = {name: value for name, value in record.items() if name in CrawlResult.model_fields}
+    fields.setdefault('html', '')
+    fields.setdefault('success', markdown is not None)
+    try:
+        return CrawlResult(**fields, markdown=markdown)
+    except ValueError: # A field this version of crawl4ai reads differently; keep what the converter needs
+        return CrawlResult(url=record.get('url', ''), html=record.get('html') or '', success=fields['success'],
+                           error_message=record.get('error_message'), metadata=record.get('metadata') or {},
+                           links=record.get('links') or {}, markdown=markdown)
+
+# Sends pages to a crawl4ai server (the crawl4ai service in docker-compose.yml) instead of starting a local
+# browser. Pages requested at about the same time are sent together in jobs of up to batch_size URLs, and
+# at most max_tasks jobs run at once, so the server's task limit is never exceeded; further pages wait
+# here. Results are streamed back from /crawl/stream as each page finishes or, with poll, requested from
+# the task API (/crawl, then /task/<id>) of older servers.
+class RemoteCrawler:
+    def __init__(self, base_url: str, token: str | None = None, max_tasks: int = DEFAULT_REMOTE_TASKS,
+                 batch_size: int = DEFAULT_REMOTE_BATCH, poll: bool = False):
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        self.client = httpx.AsyncClient(base_url=base_url.rstrip('/'), headers=headers,
+                                        timeout=httpx.Timeout(REMOTE_TIMEOUT, connect=10),
+                                        limits=httpx.Limits(max_connections=max_tasks, max_keepalive_connections=max_tasks))
+        self.batch_size = batch_size
+        self.poll = poll
+        self._slots = asyncio.Semaphore(max_tasks)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._dispatcher = None
+        self._jobs: set[asyncio.Task] = set()
+
+    async def arun(self, url: str, config=None):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((url, config, future))
+        return CrawlResultContainer(await future)
+
+    async def _dispatch(self):
+        while True:
+            batch = [await self._queue.get()]
+            await self._slots.acquire() # Backpressure: wait until the server has a free task slot
+            deadline = asyncio.get_running_loop().time() + BATCH_WINDOW
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), deadline - asyncio.get_running_loop().time()))
+                except asyncio.TimeoutError:
+                    break
+            # Pages crawled with different settings go in separate jobs, each in the slot just taken
+            groups: dict[int, list] = {}
+            for item in batch:
+                groups.setdefault(id(item[1]), []).append(item)
+            for number, group in enumerate(groups.values()):
+                if number:
+                    await self._slots.acquire()
+                job = asyncio.create_task(self._run_job(group))
+                self._jobs.add(job)
+                job.add_done_callback(self._jobs.discard)
+
+    async def _run_job(self, items: list):
+        futures: dict[str, list[asyncio.Future]] = {}
+        for url, _, future in items:
+            futures.setdefault(url, []).append(future)
+        config = items[0][1] or CrawlerRunConfig()
+        try:
+            if self.poll:
+                await self._poll_job(list(futures), config, futures)
+            else:
+                await self._stream_job(list(futures), config, futures)
+            error = RuntimeError("The crawl4ai server returned no result for this page.")
+        except httpx.HTTPStatusError as e:
+            error = RuntimeError(f"crawl4ai server answered {e.response.status_code} {e.response.reason_phrase}")
+        except (httpx.HTTPError, ValueError) as e:
+            error = RuntimeError(f"crawl4ai server: {e}")
+        except Exception as e: # Unexpected replies, e.g. records that aren't objects; never leave a page waiting
+            error = RuntimeError(f"crawl4ai server: unexpected reply ({type(e).__name__}: {e})")
+        finally:
+            self._slots.release()
+        for pending in futures.values():
+            for future in pending:
+                if not future.done():
+                    future.set_exception(error)
+
+    def _resolve(self, futures: dict, record: dict) -> None:
+        result = result_from_record(record)
+        url = result.url if result.url in futures else \
+            next((pending for pending in futures if normalize_url(pending) == normalize_url(result.url)), None)
+        for future in futures.pop(url, []):
+            if not future.done():
+                future.set_result(result)
+
+    async def _stream_job(self, urls: list[str], config, futures: dict) -> None:
+        payload = {'urls': urls, 'browser_config': {}, 'crawler_config': config.clone(stream=True).dump()}
+        async with self.client.stream('POST', '/crawl/stream', json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines(): # One JSON record per page, as soon as it is done
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('status') == 'completed':
+                    break
+                if 'url' in record:
+                    self._resolve(futures, record)
+
+    async def _poll_job(self, urls: list[str], config, futures: dict) -> None:
+        payload = {'urls': urls, 'priority': 10, 'browser_config': {}, 'crawler_config': config.dump()}
+        response = await self.client.post('/crawl', json=payload)
+        response.raise_for_status()
+        submitted = response.json()
+        task_id = submitted.get('task_id') if isinstance(submitted, dict) else None
+        if not task_id:
+            raise ValueError(f"no task_id in the reply to /crawl: {response.text[:200]}")
+        deadline = asyncio.get_running_loop().time() + REMOTE_TIMEOUT
+        while True:
+            if asyncio.get_running_loop().time() > deadline:
+                raise ValueError(f"task {task_id} not done after {REMOTE_TIMEOUT} seconds")
+            await asyncio.sleep(POLL_INTERVAL)
+            response = await self.client.get(f"/task/{task_id}")
+            response.raise_for_status()
+            status = response.json()
+            if not isinstance(status, dict):
+                raise ValueError(f"unexpected reply from /task/{task_id}: {response.text[:200]}")
+            if status.get('status') == 'failed':
+                raise ValueError(status.get('error') or "crawl job failed")
+            if status.get('status') == 'completed':
+                break
+        for record in status.get('results') or [status.get('result') or {}]:
+            if 'url' in record:
+                self._resolve(futures, record)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        for task in [self._dispatcher, *self._jobs]:
+            if task is not None:
+                task.cancel()
+        await self.client.aclose()
+
+# A converted page and how it was fetched: 'cache' (unchanged since the last run), 'http' or 'browser'
+class Page(NamedTuple):
+    url: str
+    content: str
+    source_format: str
+    extension: str
+    title: str
+    links: list[str]
+    fetched_by: str = 'browser'
+
+def page_from_result(url: str, actual_result) -> Page | None:
+    extracted = extract_content(actual_result)
+    if not extracted:
+        return None
+    content, source_format, extension = extracted
+    title = ((getattr(actual_result, 'metadata', None) or {}).get('title') or url).strip()
+    return Page(url, str(content), source_format, extension, title, page_links(getattr(actual_result, 'links', None), url))
+
+# The default crawl settings, as the scraping step takes them. Building them takes longer than converting
+# a typical page, so it is done once.
+@functools.cache
+def scrape_params() -> dict:
+    params = CrawlerRunConfig().__dict__.copy()
+    params.pop('url', None)
+    return params
+
+# Converts HTML fetched without a browser with the same scraping and Markdown steps the browser path uses
+def convert_html(url: str, html: str) -> Page:
+    result = LXMLWebScrapingStrategy().scrap(url, html, **scrape_params())
+    markdown = DefaultMarkdownGenerator().generate_markdown(input_html=result.cleaned_html, base_url=url)
+    title = (result.metadata.get('title') or url).strip()
+    return Page(url, markdown.raw_markdown, "markdown (static)", "md", title, page_links(result.links.model_dump(), url), 'http')
+
+# Why a page fetched without a browser looks like it needs JavaScript to show its content, or None
+def needs_browser(html: str, markdown: str) -> str | None:
+    if EMPTY_APP_ROOT.search(html):
+        return "empty JavaScript app root"
+    words = len(markdown.split())
+    if words < MIN_STATIC_WORDS and SCRIPT_TAG.search(html):
+        return f"only {words} words without JavaScript"
+    if words < 3 * MIN_STATIC_WORDS and NOSCRIPT_NOTICE.search(html):
+        return "asks for JavaScript"
+    return None
+
+# Converted pages kept between runs, one JSON file per URL, with what it takes to tell whether a page
+# changed since: its ETag, Last-Modified date and a hash of the raw response body
+class PageCache:
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, url: str) -> dict | None:
+        try:
+            with open(self._path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('url') == url else None
+
+    def put(self, url: str, entry: dict) -> None:
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.{os.getpid()}.partial"
+        with open(partial_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(partial_path, path) # Never leaves a half-written entry behind
+
+# One connection pool for the whole run: connections are kept alive and reused, and HTTP/2 multiplexes
+# the requests to a host over one of them
+def create_http_client(concurrency: int) -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=True, follow_redirects=True, timeout=HTTP_TIMEOUT,
+                             headers={'User-Agent': BrowserConfig().user_agent},
+                             limits=httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2))
+
+# If-None-Match and If-Modified-Since from a cache entry, so an unchanged page comes back as 304 without a body
+def conditional_headers(entry: dict | None) -> dict:
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def response_validators(response: httpx.Response, entry: dict | None) -> dict:
+    if response.status_code == 304:
+        return {'etag': response.headers.get('etag', entry.get('etag')),
+                'last_modified': response.headers.get('last-modified', entry.get('last_modified')),
+                'content_hash': entry.get('content_hash')}
+    return {'etag': response.headers.get('etag'), 'last_modified': response.headers.get('last-modified'),
+            'content_hash': hashlib.sha256(response.content).hexdigest()}
+
+# Fetches and converts pages the cheapest way that works. With a cache, a conditional request first asks
+# whether the cached page changed (by ETag, Last-Modified, or for servers that send neither, a hash of the
+# body). Otherwise the 'auto' fetcher converts the plain HTTP response, and renders the page in the browser
+# only when it looks like it needs JavaScript. 'http' never starts the browser; 'browser' always renders.
+class Fetcher:
+    def __init__(self, crawler, client: httpx.AsyncClient, limiter: DomainLimiter, mode: str = 'auto',
+                 cache: PageCache | None = None, respect_robots: bool = False):
+        self.crawler = crawler
+        self.client = client
+        self.limiter = limiter
+        self.mode = mode
+        self.cache = cache
+        # robots.txt is checked here before any request, whichever way the page is fetched
+        self.config = CrawlerRunConfig(check_robots_txt=respect_robots)
+        self.robots = RobotsParser() if respect_robots else None
+        self.counts = dict.fromkeys(FETCH_NOTES, 0)
+
+    async def _get(self, url: str, entry: dict | None) -> httpx.Response | None:
+        async with self.limiter.for_url(url):
+            async with self.limiter.total:
+                try:
+                    return await self.client.get(url, headers=conditional_headers(entry))
+                except httpx.HTTPError as e:
+                    if self.mode == 'http':
+                        raise RuntimeError(f"HTTP request failed: {e}") from e
+                    return None # Let the browser have a go and report the error
+
+    async def _convert(self, url: str, response: httpx.Response) -> tuple[Page | None, str]:
+        if response.status_code != 200:
+            return None, f"HTTP {response.status_code}"
+        content_type = response.headers.get('content-type', 'text/html')
+        if 'html' not in content_type:
+            return None, f"not an HTML page ({content_type})"
+        html = response.text
+        page = await asyncio.to_thread(convert_html, str(response.url), html)
+        reason = needs_browser(html, page.content)
+        if reason and self.mode == 'auto':
+            return None, reason
+        return page._replace(url=url), ""
+
+    def _store(self, url: str, page: Page, validators: dict) -> None:
+        page_fields = page._asdict()
+        del page_fields['fetched_by']
+        self.cache.put(url, {'url': url, **validators, 'checked_at': time.time(), 'page': page_fields,
+                             'fetched_by': page.fetched_by, 'fetcher': self.mode})
+
+    # Whether a cached page was fetched the way this fetcher's mode would fetch it: auto takes browser renders
+    # and the static conversions auto itself accepted, not pages 'http' mode converted without checking
+    def _usable(self, entry: dict) -> bool:
+        if self.mode == 'auto':
+            return entry.get('fetched_by') == 'browser' or (entry.get('fetched_by') == 'http' and entry.get('fetcher') == 'auto')
+        return entry.get('fetched_by') == self.mode
+
+    async def fetch(self, url: str) -> Page:
+        if self.robots and not await self.robots.can_fetch(url, self.client.headers['User-Agent']):
+            raise RuntimeError("Access denied by robots.txt")
+        entry = self.cache.get(url) if self.cache else None
+        if entry and not self._usable(entry):
+            entry = None # Fetched with another fetcher: convert again, and replace the entry
+        response = await self._get(url, entry) if entry or self.mode != 'browser' else None
+        validators = response_validators(response, entry) if response is not None and response.status_code in (200, 304) else {}
+        if entry and validators and validators['content_hash'] == entry.get('content_hash'):
+            self.cache.put(url, {**entry, **validators, 'checked_at': time.time()})
+            self.counts['cache'] += 1
+            return Page(**entry['page'], fetched_by='cache')
+
+        if response is not None and self.mode != 'browser':
+            page, reason = await self._convert(url, response)
+            if page is None and self.mode == 'http':
+                raise RuntimeError(reason)
+        else:
+            page = None
+        if page is None:
+            actual_result = await crawl_url(self.crawler, url, self.limiter, self.config)
+            page = page_from_result(url, actual_result)
+            if page is None:
+                raise RuntimeError("Could not extract any content (Markdown or HTML).")
+            if not validators: # Keep what the browser got; the body hash follows on the next plain request
+                response_headers = {name.lower(): value for name, value in (getattr(actual_result, 'response_headers', None) or {}).items()}
+                validators = {'etag': response_headers.get('etag'), 'last_modified': response_headers.get('last-modified'),
+                              'content_hash': None}
+        if self.cache:
+            self._store(url, page, validators)
+        self.counts[page.fetched_by] += 1
+        return page
+
+def fetch_summary(fetcher: Fetcher) -> str:
+    return ', '.join(f"{count} {FETCH_NOTES[how]}" for how, count in fetcher.counts.items() if count) or "none"
+
+# Crawls many URLs with one browser and writes every page as soon as it is done. Returns the number of failures.
+async def run_batch(fetcher: Fetcher, urls: list[str], writer: PageWriter) -> int:
+    async def crawl(url):
+        try:
+            return url, await fetcher.fetch(url), None
+        except PlaywrightErrors.Error:
+            raise # Missing browsers and the like affect every page, so they stop the batch
+        except Exception as e:
+            return url, None, e
+
+    failures = 0
+    tasks = [asyncio.create_task(crawl(url)) for url in urls]
+    try:
+        for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+            url, page, error = await task
+            if error:
+                failures += 1
+                print(f"[{done}/{len(urls)}] Failed {url}: {error}", file=sys.stderr)
+                continue
+            location = writer.save(url, page.source_format, page.content, page.extension)
+            print(f"[{done}/{len(urls)}] {url} -> {location} ({FETCH_NOTES[page.fetched_by]})", file=writer.log)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return failures
+
+# Canonical form of a URL for deduplication: no fragment, lowercase host, no default port, no tracking parameters
+def normalize_url(url: str, base: str | None = None) -> str:
+    parts = urlsplit(urljoin(base, url) if base else url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f"{host}:{parts.port}"
+    query = urlencode([(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if not key.lower().startswith('utm_')])
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+# The start page's directory, so a crawl from /docs/latest/intro stays within /docs/latest/
+def default_path_prefix(url: str) -> str:
+    path = urlsplit(url).path or '/'
+    return path[:path.rfind('/') + 1]
+
+def in_scope(url: str, host: str, path_prefix: str) -> bool:
+    parts = urlsplit(url)
+    return (parts.scheme in ('http', 'https') and parts.netloc == host and parts.path.startswith(path_prefix)
+            and not parts.path.lower().endswith(SKIPPED_EXTENSIONS))
+
+# Normalized absolute URLs of every link on a crawled page
+def page_links(links: dict | None, page_url: str) -> list[str]:
+    links = links or {}
+    hrefs = [link.get('href') for group in ('internal', 'external') for link in links.get(group, [])]
+    urls = [normalize_url(href, page_url) for href in hrefs
+            if href and not href.startswith(('mailto:', 'javascript:', 'tel:'))]
+    return list(dict.fromkeys(urls))
+
+# Writes index.md: every saved page with its title and file, indented by link depth, then the pages that failed
+def write_index(path: str, start_url: str, pages: list[tuple[int, str, str, str]], failed: list[tuple[str, str]]) -> None:
+    lines = [f"# Crawl of {start_url}", "", f"{len(pages)} page(s) saved.", ""]
+    for depth, url, title, filename in sorted(pages):
+        lines.append(f"{'  ' * depth}- [{title}]({filename}) - {url}")
+    if failed:
+        lines += ["", "## Not saved", ""] + [f"- {url}: {reason}" for url, reason in sorted(failed)]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+
+# Crawls a site breadth-first from start_url with concurrency workers: links within the host and path prefix
+# are followed up to max_depth hops, every normalized URL once, until max_pages are saved. Returns (pages, failed).
+# The index is written only when the pages are saved as files, which it links to.
+async def crawl_site(fetcher: Fetcher, start_url: str, writer: PageWriter, max_depth: int, max_pages: int,
+                     concurrency: int, path_prefix: str | None = None):
+    start_url = normalize_url(start_url)
+    host = urlsplit(start_url).netloc
+    path_prefix = path_prefix or default_path_prefix(start_url)
+    frontier: asyncio.Queue = asyncio.Queue()
+    frontier.put_nowait((start_url, 0))
+    seen = {start_url}
+    pages = [] # (depth, url, title, filename)
+    failed = [] # (url, reason)
+
+    async def worker():
+        while True:
+            url, depth = await frontier.get()
+            try:
+                if len(pages) >= max_pages:
+                    continue # Drain the rest of the frontier
+                try:
+                    page = await fetcher.fetch(url)
+                except PlaywrightErrors.Error:
+                    raise # Missing browsers and the like affect every page, so they stop the crawl
+                except Exception as e:
+                    failed.append((url, str(e)))
+                    print(f"Failed {url}: {e}", file=sys.stderr)
+                    continue
+                if len(pages) >= max_pages:
+                    continue
+                location = writer.save(url, page.source_format, page.content, page.extension)
+                filename = os.path.relpath(location, writer.output_dir) if writer.to_files else location
+                pages.append((depth, url, page.title, filename))
+                print(f"[{len(pages)}/{max_pages}] depth {depth}: {url} -> {filename} ({FETCH_NOTES[page.fetched_by]})", file=writer.log)
+                if depth < max_depth:
+                    for link in page.links:
+                        if link not in seen and in_scope(link, host, path_prefix):
+                            seen.add(link)
+                            frontier.put_nowait((link, depth + 1))
+            finally:
+                frontier.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    drained = asyncio.create_task(frontier.join())
+    try:
+        # A worker only finishes by raising, which ends the crawl instead of leaving join() waiting forever
+        done, _ = await asyncio.wait([drained, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        drained.cancel()
+        for task in workers:
+            task.cancel()
+    if writer.to_files:
+        write_index(os.path.join(writer.output_dir, 'index.md'), start_url, pages, failed)
+    return pages, failed
+
+# The local browser, started when first needed, or a client for the crawl4ai server given with --remote
+def create_crawler(args):
+    if args.remote:
+        return RemoteCrawler(args.remote, args.remote_token, args.remote_tasks, args.remote_batch, args.remote_poll)
+    return LazyCrawler()
+
 async def async_main():
     parser = argparse.ArgumentParser(description='Convert a website to Markdown.')
-    parser.add_argument('-i', '--input', type=str, required=True, help='The URL of the website to convert.')
-    parser.add_argument('-o', '--output', type=str, help='The file path to save the content. If not provided, a filename is derived from the URL and saved in the current directory.')
+    parser.add_argument('-i', '--input', type=str, help='The URL of the website to convert.')
+    parser.add_argument('-o', '--output', type=str, help="The file path to save the content, or '-' for stdout. If not provided, a filename is derived from the URL and saved in the current directory. In batch and site crawl modes, every page goes to this one file or stream instead of --output-dir.")
+    parser.add_argument('--input-file', type=str, help="Batch mode: file with one URL per line, or '-' to read them from stdin.")
+    parser.add_argument('--output-dir', type=str, default='.', help='Batch mode: directory for the Markdown files, named after their URLs (default: current directory).')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help=f'Batch and site crawl modes: pages crawled at once (default: {DEFAULT_CONCURRENCY}).')
+    parser.add_argument('--per-domain', type=int, default=DEFAULT_PER_DOMAIN, help=f'Batch and site crawl modes: pages crawled at once from one host (default: {DEFAULT_PER_DOMAIN}).')
+    parser.add_argument('--crawl', action='store_true', help='Site crawl mode: follow links from the -i page within its host and path, saving every page plus an index.md to --output-dir.')
+    parser.add_argument('--max-depth', type=int, default=DEFAULT_MAX_DEPTH, help=f'Site crawl: link hops to follow from the start page (default: {DEFAULT_MAX_DEPTH}).')
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES, help=f'Site crawl: stop after saving this many pages (default: {DEFAULT_MAX_PAGES}).')
+    parser.add_argument('--path-prefix', type=str, help="Site crawl: only follow links whose path starts with this (default: the start page's directory).")
+    parser.add_argument('--ignore-robots', action='store_true', help='Site crawl: also fetch pages that robots.txt disallows.')
+    parser.add_argument('--cache-dir', type=str, help='Keep converted pages here between runs, and re-render a page only when a conditional request shows it changed.')
+    parser.add_argument('--remote', type=str, metavar='URL', help='Send pages that need a browser to this crawl4ai server (e.g. http://localhost:11235, the crawl4ai service in docker-compose.yml) instead of starting a local browser.')
+    parser.add_argument('--remote-token', type=str, default=os.environ.get('CRAWL4AI_API_TOKEN'), help='Remote mode: bearer token for the server (default: $CRAWL4AI_API_TOKEN).')
+    parser.add_argument('--remote-tasks', type=int, default=DEFAULT_REMOTE_TASKS, help=f"Remote mode: crawl jobs sent at once; match the server's MAX_CONCURRENT_TASKS (default: {DEFAULT_REMOTE_TASKS}).")
+    parser.add_argument('--remote-batch', type=int, default=DEFAULT_REMOTE_BATCH, help=f'Remote mode: URLs sent in one job (default: {DEFAULT_REMOTE_BATCH}).')
+    parser.add_argument('--remote-poll', action='store_true', help="Remote mode: submit jobs to the task API (/crawl, then poll /task/<id>) of older servers instead of streaming results from /crawl/stream.")
+    parser.add_argument('--format', dest='output_format', choices=OUTPUT_FORMATS, default='markdown', help="'markdown' saves pages with a '--- Source: ... ---' header; 'jsonl' writes one {url, source_format, markdown} record per line to -o, or to stdout without -o (default: markdown).")
+    parser.add_argument('--fetcher', choices=FETCHERS, default='auto', help="How pages are fetched: 'auto' converts plain HTTP responses and uses the browser only for pages that need JavaScript, 'http' never starts the browser, 'browser' renders every page (default: auto).")
 
     if len(sys.argv) == 1: # No arguments provided, print help and exit.
         parser.print_help(sys.stderr)
         sys.exit(1)
     args = parser.parse_args()
+    if bool(args.input) == bool(args.input_file):
+        parser.error('Give either -i/--input or --input-file.')
+    if args.concurrency < 1 or args.per_domain < 1:
+        parser.error('--concurrency and --per-domain must be at least 1.')
+    if args.crawl and not args.input:
+        parser.error('--crawl needs the start URL in -i/--input.')
+    if args.remote_tasks < 1 or args.remote_batch < 1:
+        parser.error('--remote-tasks and --remote-batch must be at least 1.')
+
+    cache = PageCache(args.cache_dir) if args.cache_dir else None
+    try:
+        writer = PageWriter(args.output, args.output_dir, args.output_format, single=not (args.crawl or args.input_file))
+    except OSError as e:
+        print(f"Could not open {args.output}: {e}", file=sys.stderr)
+        sys.exit(1)
 
     try:
+        if not args.crawl and not args.input_file and (cache or args.remote or args.fetcher != 'browser'):
+            async with create_crawler(args) as crawler, create_http_client(1) as client:
+                fetcher = Fetcher(crawler, client, DomainLimiter(1, 1), args.fetcher, cache)
+                try:
+                    page = await fetcher.fetch(args.input)
+                except RuntimeError as e:
+                    print(f"Could not convert {args.input}: {e}", file=sys.stderr)
+                    sys.exit(1)
+            final_output_path = writer.save(args.input, page.source_format, page.content, page.extension)
+            if page.fetched_by == 'cache':
+                print(f"Unchanged since the last run; cached content saved to {final_output_path}", file=writer.log)
+            else:
+                print(f"Content ({page.source_format}, fetched by {page.fetched_by}) saved to {final_output_path}", file=writer.log)
+            return
+
+        if args.crawl:
+            if writer.to_files:
+                os.makedirs(args.output_dir, exist_ok=True)
+            print(f"Crawling {args.input} up to {args.max_depth} link(s) deep, at most {args.max_pages} pages", file=writer.log)
+            async with create_crawler(args) as crawler, create_http_client(args.concurrency) as client:
+                fetcher = Fetcher(crawler, client, DomainLimiter(args.concurrency, args.per_domain), args.fetcher, cache,
+                                  respect_robots=not args.ignore_robots)
+                pages, failed = await crawl_site(fetcher, args.input, writer, args.max_depth, args.max_pages,
+                                                 args.concurrency, args.path_prefix)
+            index_note = f"; index in {os.path.join(args.output_dir, 'index.md')}" if writer.to_files else ''
+            print(f"Done: {len(pages)} saved ({fetch_summary(fetcher)}), {len(failed)} failed{index_note}", file=writer.log)
+            return
+
+        if args.input_file:
+            try:
+                urls = read_url_list(args.input_file)
+            except OSError as e:
+                print(f"Error reading URL list: {e}", file=sys.stderr)
+                sys.exit(1)
+            if not urls:
+                print("No URLs to crawl.", file=sys.stderr)
+                sys.exit(1)
+            print(f"Crawling {len(urls)} URL(s), {args.concurrency} at a time ({args.per_domain} per host)", file=writer.log)
+            # One browser (or server connection pool) and one HTTP connection pool serve the whole batch
+            async with create_crawler(args) as crawler, create_http_client(args.concurrency) as client:
+                fetcher = Fetcher(crawler, client, DomainLimiter(args.concurrency, args.per_domain), args.fetcher, cache)
+                failures = await run_batch(fetcher, urls, writer)
+            print(f"Done: {len(urls) - failures} saved ({fetch_summary(fetcher)}), {failures} failed", file=writer.log)
+            if failures:
+                sys.exit(1)
+            return
+
         async with AsyncWebCrawler() as crawler:
             # print(f"Attempting to crawl URL: {args.input}") # Debugging line
             result_container = await crawler.arun(url=args.input)
 
             output_content = None
-            source_format_header = "" # This will be like "--- Source: markdown_v2 ---"
+            source_format = "" # Written as a header like "--- Source: markdown ---"
             file_extension = "txt" # Default extension if nothing specific found
             action_message = "" # Message to print like "Markdown content saved to..."
 
             if result_container and hasattr(result_container, '_results') and result_container._results:
                 actual_result = result_container._results[0]
 
-                if hasattr(actual_result, 'markdown_v2') and actual_result.markdown_v2:
-                    output_content = actual_result.markdown_v2
-                    source_format_header = "--- Source: markdown_v2 ---\n"
-                    file_extension = "md"
-                elif hasattr(actual_result, 'markdown') and actual_result.markdown:
-                    output_content = actual_result.markdown
-                    source_format_header = "--- Source: markdown ---\n"
-                    file_extension = "md"
-                elif hasattr(actual_result, 'fit_markdown') and actual_result.fit_markdown:
-                    output_content = actual_result.fit_markdown
-                    source_format_header = "--- Source: fit_markdown ---\n"
-                    file_extension = "md"
-                elif hasattr(actual_result, 'html') and actual_result.html:
-                    output_content = actual_result.html
-                    source_format_header = "--- Source: HTML (fallback) ---\n"
-                    file_extension = "html"
+                extracted = extract_content(actual_result)
+                if extracted:
+                    output_content, source_format, file_extension = extracted
                 else:
-                    print("Could not extract any content (Markdown or HTML).")
+                    print("Could not extract any content (Markdown or HTML).", file=writer.log)
                     if not args.output and hasattr(actual_result, '__dict__'): # Print details if not writing to file
-                        print("\nAttributes of CrawlResult object:")
+                        print("\nAttributes of CrawlResult object:", file=writer.log)
                         for attr_name in dir(actual_result):
                             if not attr_name.startswith('_'):
-                                 print(f"  {attr_name}: {getattr(actual_result, attr_name)[:200] if isinstance(getattr(actual_result, attr_name), str) else type(getattr(actual_result, attr_name))}")
+                                 print(f"  {attr_name}: {getattr(actual_result, attr_name)[:200] if isinstance(getattr(actual_result, attr_name), str) else type(getattr(actual_result, attr_name))}", file=writer.log)
                     return # Exit if no content found
 
                 if output_content:
-                    final_output_path = args.output # Use the user-specified path directly if provided
-
-                    if not final_output_path:
-                        # Derive filename if -o is not provided
-                        derived_filename = sanitize_url_to_filename(args.input, file_extension)
-                        final_output_path = os.path.join(os.getcwd(), derived_filename)
-
-                    # Ensure directory exists if output path includes directories
-                    # For now, assume if -o is given, path is valid or OS handles error.
-                    # If derived, it's in CWD, which exists.
-
-                    with open(final_output_path, 'w', encoding='utf-8') as f:
-                        f.write(source_format_header)
-                        f.write(str(output_content))
+                    # The -o path or stdout if given, otherwise a filename derived from the URL in the current directory
+                    final_output_path = writer.save(args.input, source_format, output_content, file_extension)
 
                     if file_extension == "html":
                         action_message = f"No direct Markdown content found. HTML fallback content saved to {final_output_path}"
                     else:
                         action_message = f"Markdown content saved to {final_output_path}"
-                    print(action_message)
+                    print(action_message, file=writer.log)
 
             else: # No result_container or it's empty
-                print("No result returned from crawler or result format is unexpected.")
+                print("No result returned from crawler or result format is unexpected.", file=writer.log)
                 if not args.output and result_container: # Print details if not writing to file
-                    print(f"Result container type: {type(result_container)}")
+                    print(f"Result container type: {type(result_container)}", file=writer.log)
                     if hasattr(result_container, '__dict__'):
-                         print(f"Result container attributes: {vars(result_container)}")
+                         print(f"Result container attributes: {vars(result_container)}", file=writer.log)
 
     except PlaywrightErrors.Error as pe:
         error_message = str(pe)
@@ -123,12 +790,20 @@ async def async_main():
             # traceback.print_exc() # This can be noisy, pe often has enough info
             sys.exit(1) # Exit for other playwright errors too
 
+    except BrokenPipeError:
+        # The reader of stdout (e.g. `| head`) stopped; point stdout at devnull so the exit doesn't fail flushing it
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
     except Exception as e:
         print(f"An unexpected error occurred: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc()
         sys.exit(1)
 
+    finally:
+        writer.close()
+
 # The main guard and function call should remain
 def main():
     asyncio.run(async_main())